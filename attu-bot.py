@@ -20,7 +20,11 @@ if 'DEBUG' in environ:
 else:
     print('attubot.runner > info. Debug Mode: Disabled')
 
+# startup comes first on purpose: its timer starts on import, so it has to be running before core (and discord) load
+from attubot.startup import startup  # noqa: E402, I001
 from attubot import core  # noqa: E402
 
+startup.mark('import attubot.core')
+
 if __name__ == '__main__':
     core.start_bot_loop()
@@ -0,0 +1,35 @@
+"""
+AttuBot - Prefix-indexed autocomplete choices
+Author(s): @jhnhnck <john@jhnhnck.com>
+
+This file is licensed under the Apache License, Version 2.0; See LICENSE for full text.
+"""
+
+# discord shows at most this many suggestions
+choice_limit = 25
+
+class ChoiceIndex:
+    def __init__(self, key=None):
+        # key identifies what the index was built from, so callers can tell when it is stale
+        self.key = key
+        self.prefixes = {}
+
+    def add(self, terms, choice):
+        # every prefix of every term maps straight to its (already capped) suggestion list
+        seen = set()
+
+        for term in map(str.lower, terms):
+            for end in range(len(term) + 1):
+                prefix = term[:end]
+
+                if prefix in seen:
+                    continue
+
+                seen.add(prefix)
+                choices = self.prefixes.setdefault(prefix, [])
+
+                if len(choices) < choice_limit:
+                    choices.append(choice)
+
+    def lookup(self, text):
+        return self.prefixes.get((text or '').strip().lower(), [])
@@ -0,0 +1,33 @@
+"""
+AttuBot - Injectable time source
+Author(s): @jhnhnck <john@jhnhnck.com>
+
+This file is licensed under the Apache License, Version 2.0; See LICENSE for full text.
+"""
+
+import time
+from datetime import datetime
+
+class Clock:
+    def time(self):
+        return time.time()
+
+    def now(self):
+        # naive local time, same as datetime.now()
+        return datetime.fromtimestamp(self.time())
+
+    def today(self):
+        return self.now().date()
+
+class VirtualClock(Clock):
+    def __init__(self, start):
+        self.current = float(start)
+
+    def time(self):
+        return self.current
+
+    def set(self, unix):
+        self.current = float(unix)
+
+    def advance(self, seconds):
+        self.current += seconds
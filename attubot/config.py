@@ -5,15 +5,21 @@ Author(s): @jhnhnck <john@jhnhnck.com>
 This file is licensed under the Apache License, Version 2.0; See LICENSE for full text.
 """
 
+import asyncio
 import json
 import sys
+from os import getenv
 from pathlib import Path
 
 from attubot import __version__
 from attubot.logging import get_logger
+from attubot.store import StateStore, legacy_timeline
+from attubot.timeline import Timeline, check_ids, parse_timeline
 
 logger = get_logger(__name__)
 
+id_settings = ['bot_owner', 'activity_channel', 'error_log_channel', 'attu_guild', 'jhn_guild']
+
 # --- Config Class ---
 
 class Config:
@@ -21,6 +27,12 @@ class Config:
 
     def __init__(self, file_name):
         self.file_name = Path(file_name).resolve()
+        self.store = None
+        self.timelines = {}
+        self.reload_listeners = []
+
+        # called with the timeline whenever its calendar state changes
+        self.change_listeners = []
 
     def load_from_file(self):
         if not Path(self.file_name).exists():
@@ -29,65 +41,188 @@ class Config:
 
         logger.info(f'Loading config from "{self.file_name}"')
 
-        with Path(self.file_name).open() as file:
-            self._raw = json.loads(file.read())
+        raw = self._read()
 
-        # Unpack raw json
-        if self._raw['config_version'] != self.config_version:
+        if raw['config_version'] != self.config_version:
             logger.info('Incompatible config version!')
             sys.exit(1)
 
-        self.bot_token = self._raw['auth']['token']
-        self.bot_owner = self._raw['users']['bot_owner']
+        settings = self._parse(raw)
 
-        self.wiki_key = self._raw['wiki']['key']
-        self.wiki_page = self._raw['wiki']['page']
-        self.wiki_user = self._raw['wiki']['user']
+        self._open_store(raw)
+        timelines = self._build_timelines(raw, settings['timelines'])
 
-        self.activity_channel = self._raw['channels']['activity']
-        self.year_vc = self._raw['channels']['year_vc']
-        self.announce_channel = self._raw['channels']['announcements']
-        self.doom_forum = self._raw['channels']['doom_forum']
-        self.year_link_thread = self._raw['channels']['year_links']
-        self.meta_chat_channel = self._raw['channels']['meta_chat']
-        self.error_log_channel = self._raw['channels']['error_log']
-        self.lore_channels = self._raw['channels']['lore_channels']
+        self._apply(raw, settings)
+        self._swap_timelines(timelines, settings['timelines'])
 
-        self.announce_role = self._raw['roles']['leaders']
+    def _read(self):
+        with Path(self.file_name).open() as file:
+            return json.loads(file.read())
 
-        self.epoch_time = self._raw['epoch']['time']
-        self.epoch_year = self._raw['epoch']['year']
-        self.epoch_length = self._raw['epoch']['length']
-        self.attu_guild = self._raw['guilds']['attu']
-        self.jhn_guild = self._raw['guilds']['jhn']
-        self.timestamps = self._raw['timestamps']
+    def _stat(self):
+        try:
+            stat = Path(self.file_name).stat()
+        except FileNotFoundError:
+            return None
 
-    def _save(self):
-        logger.info(f'Writing new config to "{self.file_name}"')
+        return stat.st_mtime_ns, stat.st_size
+
+    def _parse(self, raw):
+        # Unpack raw json
+        settings = {
+            'bot_token': raw['auth']['token'],
+            'bot_owner': raw['users']['bot_owner'],
+
+            'wiki_key': raw['wiki']['key'],
+            'wiki_user': raw['wiki']['user'],
+            'wiki_api': raw['wiki'].get('api', 'https://attuproject.org/api.php'),
+            'wiki_timeout': raw['wiki'].get('timeout', 30),
+
+            'activity_channel': raw['channels']['activity'],
+            'error_log_channel': raw['channels']['error_log'],
+
+            'attu_guild': raw['guilds']['attu'],
+            'jhn_guild': raw['guilds']['jhn'],
+
+            'metrics_host': raw.get('metrics', {}).get('host', '127.0.0.1'),
+            'metrics_port': raw.get('metrics', {}).get('port'),
+            'health_port': int(getenv('BOT_HEALTH_PORT')) if getenv('BOT_HEALTH_PORT') else raw.get('metrics', {}).get('health_port'),
+        }
+
+        check_ids(settings, id_settings)
+
+        # the top level describes the original timeline; `timelines` adds more, each inheriting wiki and reminder defaults
+        sections = { legacy_timeline: (raw, raw['guilds']['attu']) }
+
+        for extra in raw.get('timelines', []):
+            if extra['name'] in sections:
+                raise ValueError(f'duplicate timeline name {extra["name"]!r}')
+
+            section = { 'wiki': raw['wiki'], 'reminders': raw.get('reminders', {}), **extra }
+            sections[section['name']] = (section, section['guild'])
+
+        settings['timelines'] = { name: (section, parse_timeline(name, section, guild_id)) for name, (section, guild_id) in sections.items() }
+        return settings
+
+    def _apply(self, raw, settings):
+        # plain attribute writes with no awaits in between, so coroutines never see a half-applied config
+        self._raw = raw
+
+        for name, value in settings.items():
+            if name != 'timelines':
+                setattr(self, name, value)
+
+    async def reload(self):
+        try:
+            raw = await asyncio.to_thread(self._read)
+
+            if raw['config_version'] != self.config_version:
+                raise ValueError(f'incompatible config version {raw["config_version"]}')
+
+            settings = self._parse(raw)
+            timelines = self._build_timelines(raw, settings['timelines'])
+        except Exception as error:
+            logger.error(f'Ignoring invalid config change: {error!r}')
+            return False
+
+        if settings['bot_token'] != self.bot_token:
+            logger.warn('Bot token changed; restart the bot to apply it')
+            settings['bot_token'] = self.bot_token
 
+        self._apply(raw, settings)
+        self._swap_timelines(timelines, settings['timelines'])
+
+        logger.info(f'Reloaded config from "{self.file_name}"')
+
+        for listener in self.reload_listeners:
+            listener()
+
+        return True
+
+    async def watch(self, interval=5):
+        last = self._stat()
+
+        while True:
+            await asyncio.sleep(interval)
+            current = self._stat()
+
+            # a missing file is usually an editor mid-save; wait for it to come back
+            if current is not None and current != last:
+                last = current
+
+                # a listener failing must not end the watch; the next edit gets its own try
+                try:
+                    await self.reload()
+                except Exception as error:
+                    logger.error(f'Config reload failed: {error!r}')
+
+    def _open_store(self, raw):
+        if self.store is None:
+            state_file = getenv('BOT_STATE_FILE') or raw.get('state_file') or self.file_name.with_suffix('.db')
+            self.store = StateStore(self.file_name.parent / state_file)
+
+    def _build_timelines(self, raw, timeline_settings):
+        # new timelines load (or migrate) their state here, detached, so a failure leaves the running ones untouched
+        timelines = {}
+
+        for name, (section, settings) in timeline_settings.items():
+            timeline = self.timelines.get(name)
+
+            if timeline is None:
+                timeline = Timeline(name, self.store.timeline(name))
+                timeline.apply(settings)
+                timeline.load_state(section, migrated=name in raw.get('migrated_timelines', []))
+
+            timelines[name] = timeline
+
+        return timelines
+
+    def _swap_timelines(self, timelines, timeline_settings):
+        # existing timelines keep their state and caches and only take the new settings; removed ones are dropped
+        for name, timeline in timelines.items():
+            if name in self.timelines:
+                timeline.apply(timeline_settings[name][1])
+                self._timeline_changed(timeline)
+            else:
+                timeline.on_change = self._timeline_changed
+
+        self.timelines = timelines
+
+        # from here on the json's epoch and timestamps are stale; remember it so a lost state file is not refilled from them
+        unmarked = [name for name in timelines if name not in self._raw.get('migrated_timelines', [])]
+
+        if unmarked:
+            self._mark_migrated(unmarked)
+
+    def _mark_migrated(self, names):
+        self._raw.setdefault('migrated_timelines', []).extend(names)
+
+        try:
+            self._save()
+        except OSError as error:
+            logger.warn(f'Could not record the migration of {", ".join(names)} in "{self.file_name}": {error!r}')
+
+    def _save(self):
         with Path(self.file_name).open('w') as file:
             file.write(json.dumps(self._raw, indent=4))
 
-        self.load_from_file()
+    def _timeline_changed(self, timeline):
+        for listener in self.change_listeners:
+            listener(timeline)
 
-    def add_timestamp(self, timestamp):
-        self._raw['timestamps'].append(timestamp)
-        self._save()
+    @property
+    def default_timeline(self):
+        return self.timelines[legacy_timeline]
 
-    def set_epoch(self, time, year: int):
-        self._raw['epoch']['time'] = int(time)
-        self._raw['epoch']['year'] = year
-        self._save()
+    def timeline_for(self, guild_id, channel_id=None, fallback=True):
+        # the timeline owning the channel, else the first one configured for the guild, else (with fallback) the original one
+        candidates = [timeline for timeline in self.timelines.values() if timeline.guild_id == guild_id]
 
-    def set_epoch_length(self, length: int):
-        self._raw['epoch']['length'] = length
-        self._save()
+        for timeline in candidates:
+            if channel_id in timeline.channel_ids:
+                return timeline
 
-    @property
-    def time_paused(self):
-        return self._raw['epoch']['paused']
+        if candidates:
+            return candidates[0]
 
-    @time_paused.setter
-    def time_paused(self, value: bool):
-        self._raw['epoch']['paused'] = value
-        self._save()
+        return self.default_timeline if fallback else None
@@ -5,22 +5,33 @@ Author(s): @jhnhnck <john@jhnhnck.com>
 This file is licensed under the Apache License, Version 2.0; See LICENSE for full text.
 """
 
+import asyncio
+import hashlib
+import json
 import re
-import traceback
-from datetime import date, datetime, time, timedelta
+from datetime import datetime, timedelta
+from functools import lru_cache, partial
 from os import getenv
-from types import SimpleNamespace
-from zoneinfo import ZoneInfo
+from time import perf_counter
 
 import discord
 from discord import Permissions
-from discord.ext import tasks
-from discord.utils import snowflake_time
 
 from attubot import __version__
+from attubot.choices import ChoiceIndex
+from attubot.clock import Clock
 from attubot.config import Config
+from attubot.errors import ErrorCollector
+from attubot.jobs import JobQueue, JobQueueFull
 from attubot.logging import get_logger
-from attubot.wiki import AttuWiki
+from attubot.memory import memory_report, start_tracing, stop_tracing
+from attubot.metrics import count_discord_rate_limits, metrics, serve
+from attubot.readiness import ReadinessError, readiness_report, resource_key, warm_up
+from attubot.router import MessageRouter
+from attubot.scheduler import Scheduler
+from attubot.startup import startup
+from attubot.watchdog import LoopWatchdog
+from attubot.wiki import get_wiki, parse_users
 
 # --- Initialization ---
 
@@ -30,14 +41,46 @@ logger.info('Initializing...')
 intents = discord.Intents.default()
 intents.message_content = True
 
-bot = discord.Bot(intents=intents)
+memory_mode = getenv('BOT_MEMORY_MODE', 'default').lower()
+cache_options = {}
+
+# 0 turns the message cache off entirely
+if getenv('BOT_MAX_MESSAGES'):
+    cache_options['max_messages'] = int(getenv('BOT_MAX_MESSAGES')) or None
+
+# lean keeps only what the features read: guilds with their channels, threads and roles, and guild messages for routes
+if memory_mode == 'lean':
+    intents = discord.Intents.none()
+    intents.guilds = True
+    intents.guild_messages = True
+    intents.message_content = True
+
+    cache_options = { 'member_cache_flags': discord.MemberCacheFlags.none(), 'chunk_guilds_at_startup': False, 'max_messages': None, **cache_options }
+
+# commands are synced by sync_commands() in on_connect, and only when their schema changed
+bot = discord.Bot(intents=intents, auto_sync_commands=False, **cache_options)
 config = Config(getenv('BOT_CONFIG_FILE'))
 
+router = MessageRouter()
+
+# every timekeeping function reads the time through this; swap in a VirtualClock for benchmarks and simulations
+clock = Clock()
+
 separators = ['<', '=', '+', r'\>', '/', '&', ':', '$', r'\*', '%', '@', '⁂', 'xXx', '\\\\', '?', '^', r'\|', r'\~', '-']
 flipped_separators = { '<': '>', r'\>': '<', '/': '\\\\', '\\\\': '/' }
 
 build_format = '%a %b %d %H:%M:%S %Z %Y'
-trigger_time = time(17, 0, tzinfo=ZoneInfo(getenv('TZ')))
+
+background_tasks = {}
+
+# failed rollovers are retried after 1, 2, 4... minutes, at most an hour apart; timeline name -> failed attempts
+rollover_retry_delay = 60
+rollover_retry_max = 3600
+rollover_retries = {}
+
+# timeline name -> Resources resolved by the warm-up, so the rollover never looks a channel up cold
+resource_cache = {}
+year_table_size = 20
 
 # --- Utilities ---
 
@@ -51,325 +94,855 @@ def format_year_line(year):
     else:
         return f'# {sep * 3} Year {year} PC {sep * 3}'
 
-def get_year_status():
-    time_diff_sec = (datetime.combine(date.today(), trigger_time) - datetime.fromtimestamp(config.epoch_time).astimezone()).total_seconds()
-    elapsed_days = int(time_diff_sec / 86400)
-    year = config.epoch_year + (elapsed_days // config.epoch_length)
-
-    if (elapsed_days % config.epoch_length) == 0 and datetime.now().time() < trigger_time:
-        year -= 1
-
-    return elapsed_days, year
-
-def get_next_year():
-    if config.time_paused:
-        return datetime.fromtimestamp(0).astimezone()
+def get_year_index(timeline):
+    return timeline.year_index(clock.time())
 
-    elapsed_days, _ = get_year_status()
-    new_date = datetime.combine(date.today(), trigger_time) + timedelta((config.epoch_length - elapsed_days) % config.epoch_length)
+def get_timeline_version(timeline):
+    return timeline.version(clock.time())
 
-    if (elapsed_days % config.epoch_length) == 0 and datetime.now().time() >= trigger_time:
-        new_date += timedelta(days=config.epoch_length)
+def get_year_status(timeline):
+    return get_year_index(timeline).status(clock.time())
 
-    return new_date
+def get_next_year(timeline):
+    return get_year_index(timeline).next_year(clock.time())
 
-def get_year_span(year: int):
-    result = SimpleNamespace(start_time=0, end_time=0, duration=0)
-
-    _, current_year = get_year_status()
-    next_year = get_next_year()
-
-    # Invalid Years
+def get_year_span(timeline, year: int):
     if year <= 0:
         logger.error(f'get_year() requested with invalid year: {year}')
 
-    # Past Years
-    elif year < current_year:
-        result.start_time = int(snowflake_time(config.timestamps[year - 1]).timestamp())
-        result.end_time = int(snowflake_time(config.timestamps[year]).timestamp())
-
-    # Current Year
-    elif year == current_year:
-        result.start_time = int(snowflake_time(config.timestamps[year - 1]).timestamp())
-        result.end_time = int(next_year.timestamp())
-
-    # Next Year
-    elif year == (current_year + 1):
-        result.start_time = int(next_year.timestamp())
-        result.end_time = int((next_year + timedelta(days=(config.epoch_length * (year - current_year - 1)))).timestamp()) if not config.time_paused else 0
-
-    # Future Years
-    elif not config.time_paused:
-        result.start_time = int((next_year + timedelta(days=(config.epoch_length * (year - current_year - 1)))).timestamp())
-        result.end_time = int((next_year + timedelta(days=(config.epoch_length * (year - current_year)))).timestamp())
-
-    result.duration = round((result.end_time - result.start_time) / 86400)
-    return result
+    return get_year_index(timeline).span(year, clock.time())
 
-def move_epoch(length: int):
-    elapsed_days, current_year = get_year_status()
-    year_span = get_year_span(current_year)
+def move_epoch(timeline, length: int, resume: bool = False):
+    elapsed_days, current_year = get_year_status(timeline)
+    year_span = get_year_span(timeline, current_year)
 
     # handle picking new year time if paused
-    if config.time_paused:
-        friday = date.today() + timedelta(days=(11 - date.today().weekday()) % 7)
+    if timeline.time_paused:
+        today = clock.today()
+        friday = today + timedelta(days=(11 - today.weekday()) % 7)
 
         # check if already passed trigger time
-        if date.today().weekday() == 4 and datetime.now().time() >= trigger_time:
+        if today.weekday() == 4 and clock.now().time() >= timeline.trigger_time:
             friday += timedelta(days=7)
 
-        config.set_epoch(datetime.combine(friday, trigger_time), current_year + 1)
+        epoch_time, epoch_year = datetime.combine(friday, timeline.trigger_time).timestamp(), current_year + 1
 
     # new length longer than current year has lasted, just extend
-    elif length >= (elapsed_days % config.epoch_length):
-        config.set_epoch(year_span.start_time, current_year)
+    elif length >= (elapsed_days % timeline.epoch_length):
+        epoch_time, epoch_year = year_span.start_time, current_year
 
     # wait for current year to complete first
     else:
-        config.set_epoch(year_span.end_time, current_year + 1)
+        epoch_time, epoch_year = year_span.end_time, current_year + 1
 
-    config.set_epoch_length(length)
-    logger.info(f'New Epoch Set: {config.epoch_year} PC at {config.epoch_time} with year length of {config.epoch_length}')
+    # epoch, length and pause flag change together in a single transaction
+    timeline.set_epoch(epoch_time, epoch_year, length=length, paused=False if resume else None)
+    logger.info(f'New Epoch Set for "{timeline.name}": {timeline.epoch_year} PC at {timeline.epoch_time} with year length of {timeline.epoch_length}')
 
 
-async def send_to_error_log(error):
+async def post_to_error_log(text):
     guild = bot.get_guild(config.jhn_guild)
     error_log = guild.get_channel(config.error_log_channel)
 
-    tb_str = ''.join(traceback.format_tb(error.__traceback__))
+    await error_log.send(text)
+
+def send_to_error_log(error):
+    # deduplicated and batched; error_collector posts the summary at a bounded rate
+    error_collector.record(error)
+
+error_collector = ErrorCollector(post_to_error_log)
+jobs = JobQueue(on_error=send_to_error_log)
+
+# the lambda reads the clock on every call, so a swapped in VirtualClock is picked up
+scheduler = Scheduler(lambda: clock.time(), on_error=send_to_error_log)  # noqa: PLW0108
+
+# a thread outside the loop that catches callbacks blocking it, and serves /health
+watchdog = LoopWatchdog(threshold=float(getenv('BOT_STALL_THRESHOLD') or 1.0), on_stall=send_to_error_log)
+
+async def run_as_job(ctx, name, run):
+    # slow commands answer straight away; progress and the result arrive as followups
+    await ctx.defer()
+
+    try:
+        job = jobs.submit(name, run, notify=ctx.send_followup, owner=ctx.user.id)
+    except JobQueueFull as error:
+        await ctx.respond(f'Failed: Too many jobs queued ({error}); try again later.', ephemeral=True)
+        return None
+
+    await ctx.respond(f'Queued job #{job.id} ({name})')
+    return job
+
+def command_timeline(ctx):
+    # the timeline whose channels the command was used in, else the server's, else the original one (e.g. on the dev server)
+    return config.timeline_for(ctx.guild_id, ctx.channel_id)
 
-    await error_log.send(f'**{error}**\n```\n{tb_str}```')
+def autocomplete_timeline(ctx):
+    return config.timeline_for(ctx.interaction.guild_id, ctx.interaction.channel_id)
 
-    logger.error(error + '\n' + tb_str)
+# --- Autocomplete ---
+
+def build_year_choices(timeline, spans):
+    index = ChoiceIndex(key=get_timeline_version(timeline))
+
+    for span in spans:
+        label = f'{span.year} PC (starts {datetime.fromtimestamp(span.start_time):%Y-%m-%d})' if span.start_time else f'{span.year} PC'
+        index.add([str(span.year)], discord.OptionChoice(name=label, value=span.year))
+
+    return index
+
+def get_year_choices(timeline, linkable=False):
+    # rebuilt once per timeline version (a new year or an epoch move); every keystroke after that is a dict lookup
+    choices = timeline.choices
+
+    if choices.years.key != get_timeline_version(timeline):
+        _, current_year = get_year_status(timeline)
+        spans = get_year_index(timeline).spans(1, current_year + year_table_size, clock.time())
+
+        # most likely picks first: the current and upcoming years, then the past from newest
+        upcoming = [span for span in spans if span.year >= current_year]
+        past = [span for span in reversed(spans) if span.year < current_year]
+
+        choices.years = build_year_choices(timeline, upcoming + past)
+        choices.linkable = build_year_choices(timeline, [span for span in upcoming + past if span.year <= len(timeline.timestamps)])
+
+    return choices.linkable if linkable else choices.years
+
+def get_channel_choices(timeline):
+    # lore channels (default first) plus meta chat, findable by any word of their name
+    choices = timeline.choices
+
+    if choices.channels.key != timeline.revision:
+        guild = bot.get_guild(timeline.guild_id)
+        index = ChoiceIndex(key=timeline.revision if guild is not None else None)
+
+        for channel_id in dict.fromkeys([timeline.default_channel, *timeline.lore_channels, timeline.meta_chat_channel]):
+            channel = guild.get_channel(channel_id) if guild is not None else None
+            name = channel.name if channel is not None else str(channel_id)
+
+            index.add([name, *name.split('-')], discord.OptionChoice(name=f'#{name}', value=str(channel_id)))
+
+        choices.channels = index
+
+    return choices.channels
+
+def resolve_channel(timeline, text):
+    # an id picked from autocomplete, a pasted mention, or a typed channel name
+    text = text.strip().removeprefix('<#').removesuffix('>').removeprefix('#')
+
+    if text.isdigit():
+        return int(text)
+
+    guild = bot.get_guild(timeline.guild_id)
+
+    for channel_id in [*timeline.lore_channels, timeline.meta_chat_channel]:
+        channel = guild.get_channel(channel_id) if guild is not None else None
+
+        if channel is not None and channel.name.lower() == text.lower():
+            return channel_id
+
+    return None
+
+async def autocomplete_year(ctx):
+    return get_year_choices(autocomplete_timeline(ctx)).lookup(ctx.value)
+
+async def autocomplete_linkable_year(ctx):
+    return get_year_choices(autocomplete_timeline(ctx), linkable=True).lookup(ctx.value)
+
+async def autocomplete_channel(ctx):
+    return get_channel_choices(autocomplete_timeline(ctx)).lookup(ctx.value)
 
 # --- Slash Commands ---
 
 @bot.slash_command(guilds_only=True)
-@discord.commands.option(name='year', required=False, description='Year Number', input_type=int)
+@discord.commands.option(name='year', required=False, description='Year Number', input_type=int, autocomplete=autocomplete_year)
 async def check_year(ctx, year: int):
-    elapsed_days, current_year = get_year_status()
+    timeline = command_timeline(ctx)
+
+    text, ephemeral = render_check_year(timeline, year, get_timeline_version(timeline))
+    await ctx.respond(text, ephemeral=ephemeral)
+
+@lru_cache(maxsize=256)
+def render_check_year(timeline, year, version):
+    _, current_year = get_year_status(timeline)
     year = year if year is not None else (current_year + 1)
-    year_span = get_year_span(year)
+    year_span = get_year_span(timeline, year)
 
     # invalid year input
     if year <= 0:
-        await ctx.respond('Failed: Only years 1 PC or later are valid options', ephemeral=True)
+        response = 'Failed: Only years 1 PC or later are valid options', True
 
     # prior years
     elif year < current_year:
-        await ctx.respond(f'Year {year} PC lasted for {year_span.duration} days, starting on <t:{year_span.start_time}:d> and ending on <t:{year_span.end_time}:d>')
+        response = f'Year {year} PC lasted for {year_span.duration} days, starting on <t:{year_span.start_time}:d> and ending on <t:{year_span.end_time}:d>', False
 
     # check if time is paused first
-    elif config.time_paused:
-        await ctx.respond('Sorry! New Years is cancelled until further notice')
+    elif timeline.time_paused:
+        response = 'Sorry! New Years is cancelled until further notice', False
 
     # current year
     elif year == current_year:
-        await ctx.respond(f'Year {year} PC will last for {year_span.duration} days, which started on <t:{year_span.start_time}:d> and will end on <t:{year_span.end_time}:d>')
+        response = f'Year {year} PC will last for {year_span.duration} days, which started on <t:{year_span.start_time}:d> and will end on <t:{year_span.end_time}:d>', False
 
     # next year (original functionality)
     elif year == (current_year + 1):
-        if (elapsed_days % config.epoch_length) == 0 and datetime.now().time() < trigger_time:
-            await ctx.respond(f'Happy New Year! Advancing to Year {current_year + 1} PC <t:{year_span.start_time}:R>')
+        if get_year_index(timeline).pending_rollover(clock.time()):
+            response = f'Happy New Year! Advancing to Year {current_year + 1} PC <t:{year_span.start_time}:R>', False
 
         else:
-            await ctx.respond(f'Advancing to Year {current_year + 1} PC <t:{year_span.start_time}:R>')
+            response = f'Advancing to Year {current_year + 1} PC <t:{year_span.start_time}:R>', False
 
     # easter egg (far future)
-    elif (config.epoch_length * (year - current_year - 1)) > (365 * 80):
-        await ctx.respond(f"Year {year} PC won't matter because we'll all be dead; try something sooner maybe", ephemeral=True)
+    elif (timeline.epoch_length * (year - current_year - 1)) > (365 * 80):
+        response = f"Year {year} PC won't matter because we'll all be dead; try something sooner maybe", True
 
     # check future years
     else:
-        await ctx.respond(f'Year {year} PC will start on <t:{year_span.start_time}:d>')
+        response = f'Year {year} PC will start on <t:{year_span.start_time}:d>', False
+
+    return response
 
 @bot.slash_command(guilds_only=True)
-@discord.commands.option(name='year', required=True, description='Year Number', input_type=int)
-@discord.commands.option(name='channel', required=False, description='Lore Channel', input_type=discord.TextChannel)
-async def link_year(ctx, year: int, channel: discord.TextChannel):
-    channel_id = 0
+@discord.commands.option(name='year', required=True, description='Year Number', input_type=int, autocomplete=autocomplete_linkable_year)
+@discord.commands.option(name='channel', required=False, description='Lore Channel', input_type=str, autocomplete=autocomplete_channel)
+async def link_year(ctx, year: int, channel: str):
+    timeline = command_timeline(ctx)
 
-    if channel is None:
-        channel_id = config.lore_channels[3]
+    channel_id = timeline.default_channel if channel is None else resolve_channel(timeline, channel)
 
-    elif channel.id not in config.lore_channels and channel.id != config.meta_chat_channel:
+    if channel_id not in timeline.lore_channels and channel_id != timeline.meta_chat_channel:
         await ctx.respond('Failed: Channel is not a lore channel.', ephemeral=True)
         return
 
-    else:
-        channel_id = channel.id
+    text, ephemeral = render_link_year(timeline, year, channel_id, get_timeline_version(timeline))
+    await ctx.respond(text, ephemeral=ephemeral)
 
-    if year < 1 or year > len(config.timestamps):
-        await ctx.respond(f'Failed: Pick a year between 1 and {len(config.timestamps)}.', ephemeral=True)
-        return
+@lru_cache(maxsize=256)
+def render_link_year(timeline, year, channel_id, version):
+    year_index = get_year_index(timeline)
+
+    if year < 1 or year > year_index.marker_count:
+        return f'Failed: Pick a year between 1 and {year_index.marker_count}.', True
+
+    # exact marker in that channel when indexed; otherwise the main marker, which lands the jump at the right moment
+    message_id = timeline.markers.get((year, channel_id), year_index.marker(year))
 
     # Send message link
-    await ctx.respond(f'{year} PC: https://discord.com/channels/{config.attu_guild}/{channel_id}/{config.timestamps[year - 1]}')
+    return f'{year} PC: https://discord.com/channels/{timeline.guild_id}/{channel_id}/{message_id}', False
 
-@bot.slash_command(guilds_only=True, default_member_permissions=Permissions.all())
-@discord.commands.option(name='option', required=True, description='Debug Option to Run', input_type=str)
-async def debug(ctx, option: str):
-    options = ['version', 'year_stats', 'force_error']
-    options.sort()
+@bot.slash_command(guilds_only=True)
+@discord.commands.option(name='page', required=False, description='Page Number (defaults to the latest years)', input_type=int)
+async def year_table(ctx, page: int):
+    timeline = command_timeline(ctx)
 
-    if ctx.user.id != config.bot_owner:
-        await ctx.respond("You're not my real dad!")
+    _, current_year = get_year_status(timeline)
+    page_count = -(-(current_year + 1) // year_table_size)
+    page = page if page is not None else page_count
+
+    if page < 1 or page > page_count:
+        await ctx.respond(f'Failed: Pick a page between 1 and {page_count}.', ephemeral=True)
         return
 
-    if option == 'version':
-        build_time = datetime.strptime(getenv('BUILD_TIME'), build_format)
+    first = (page - 1) * year_table_size + 1
+    lines = []
+
+    for span in get_year_index(timeline).spans(first, min(first + year_table_size - 1, current_year + 1), clock.time()):
+        # past years
+        if span.year < current_year:
+            lines.append(f'**{span.year} PC**: <t:{span.start_time}:d> to <t:{span.end_time}:d> ({span.duration} days)')
+
+        # current year
+        elif span.year == current_year:
+            end = f'<t:{span.end_time}:d> ({span.duration} days)' if not timeline.time_paused else '??? (time is paused)'
+            lines.append(f'**{span.year} PC**: <t:{span.start_time}:d> to {end}')
 
-        await ctx.respond('\n'.join([
-            f'Version: {__version__}',
-            f'Container Build Time: <t:{int(build_time.timestamp())}:f>',
-        ]))
+        # next year
+        elif not timeline.time_paused:
+            lines.append(f'**{span.year} PC**: starts <t:{span.start_time}:R>')
 
-    elif option == 'year_stats':
-        elapsed_days, current_year = get_year_status()
-        year_span = get_year_span(current_year)
+    lines.append(f'-# Page {page} of {page_count}')
+    await ctx.respond('\n'.join(lines))
 
-        await ctx.respond('\n'.join([
+# --- Debug Options ---
+
+async def debug_version(ctx, number):
+    build_time = datetime.strptime(getenv('BUILD_TIME'), build_format)
+
+    await ctx.respond('\n'.join([
+        f'Version: {__version__}',
+        f'Container Build Time: <t:{int(build_time.timestamp())}:f>',
+    ]))
+
+async def debug_year_stats(ctx, number):
+    # the timeline used here, or every timeline when run from elsewhere (e.g. the dev server)
+    timeline = config.timeline_for(ctx.guild_id, ctx.channel_id, fallback=False)
+    lines = []
+
+    for timeline in [timeline] if timeline is not None else config.timelines.values():
+        elapsed_days, current_year = get_year_status(timeline)
+        year_span = get_year_span(timeline, current_year)
+        next_rollover = scheduler.next_run(f'rollover:{timeline.name}')
+        next_rollover = f'<t:{int(next_rollover)}:f>' if next_rollover is not None else 'Not Scheduled'
+
+        lines.extend([
+            f'**Timeline: {timeline.name}**',
             f'Current Year: {current_year} PC',
             f'Year Span: <t:{year_span.start_time}:f> to <t:{year_span.end_time}:f> ({year_span.duration} days)',
-            f'Attu Epoch: {config.epoch_year} PC at <t:{config.epoch_time}:f>',
+            f'Attu Epoch: {timeline.epoch_year} PC at <t:{timeline.epoch_time}:f>',
             f'Time Since Epoch: {elapsed_days} Days',
-            f'Next Task Iteration: <t:{int(task_year_check.next_iteration.timestamp())}:f>',
-        ]))
+            f'Next Rollover: {next_rollover}',
+        ])
+
+    await ctx.respond('\n'.join(lines)[:2000])
+
+async def debug_routes(ctx, number):
+    lines = [f'`{route.name}` on <#{route.channel_id}>: {route.hits} hits' for route in router.stats()]
+    lines.append(f'Unrouted messages dropped: {router.dropped}')
+
+    await ctx.respond('\n'.join(lines))
+
+async def debug_metrics(ctx, number):
+    lines = ['**Commands**']
+    lines.extend(f'`/{labels["command"]}`: {count} calls, avg {average * 1000:.0f} ms, max {peak * 1000:.0f} ms' for labels, count, average, peak in metrics.summary('attubot_command_seconds'))
+
+    lines.append('**Wiki API**')
+    lines.extend(f'`{labels["action"]}`: {count} calls, avg {average * 1000:.0f} ms, max {peak * 1000:.0f} ms' for labels, count, average, peak in metrics.summary('attubot_wiki_request_seconds'))
+
+    lines.append('**Slowest Discord Routes**')
+    lines.extend(f'`{labels["method"]} {labels["route"]}`: {count} calls, avg {average * 1000:.0f} ms, max {peak * 1000:.0f} ms' for labels, count, average, peak in metrics.summary('attubot_discord_request_seconds')[:5])
+
+    lines.append('**Rollover Steps**')
+    lines.extend(f'`{labels["step"]}`: avg {average * 1000:.0f} ms, max {peak * 1000:.0f} ms' for labels, _, average, peak in metrics.summary('attubot_rollover_step_seconds'))
+
+    rate_limits = metrics.counters.get('attubot_rate_limited_total', {})
+    lag = metrics.gauges.get('attubot_event_loop_lag_seconds', {}).get((), 0)
+
+    rate_limited = ', '.join(f'{dict(labels)["service"]} {count}' for labels, count in rate_limits.items())
+
+    lines.append(f'Rate Limited: {rate_limited or "none"}')
+    lines.append(f'Event Loop Lag: {lag * 1000:.1f} ms')
+
+    lines.append(f'**Event Loop Stalls** (over {watchdog.threshold}s)')
+    lines.extend(f'<t:{int(stall.started)}:R>: {stall.duration:.2f}s in `{stall.location}`' for stall in list(watchdog.stalls)[-5:])
+
+    await ctx.respond('\n'.join(lines)[:2000])
+
+async def debug_startup(ctx, number):
+    await ctx.respond('\n'.join(startup.report()))
+
+async def debug_jobs(ctx, number):
+    lines = ['**Active Jobs**']
+    lines.extend(f'#{job.id} `{job.name}` {job.status} since <t:{int(job.started or job.created)}:R>{f": {job.progress}" if job.progress else ""}' for job in jobs.active())
+
+    lines.append('**Recent Jobs**')
+    lines.extend(f'#{job.id} `{job.name}` {job.status} <t:{int(job.finished)}:R>' for job in reversed(jobs.recent()))
+
+    await ctx.respond('\n'.join(lines)[:2000])
+
+async def debug_cancel_job(ctx, number):
+    if number is None:
+        await ctx.respond('Failed: Submit the job number in number field', ephemeral=True)
+        return
+
+    if jobs.cancel(number):
+        await ctx.respond(f'Cancelling job #{number}')
+    else:
+        await ctx.respond(f'Failed: No active job #{number}', ephemeral=True)
+
+async def debug_memory(ctx, number):
+    # number starts allocation tracing keeping that many frames per allocation; 0 stops it
+    if number is not None and number > 0:
+        start_tracing(number)
+    elif number == 0:
+        stop_tracing()
+
+    await ctx.respond('\n'.join(memory_report(bot, memory_mode))[:2000])
+
+async def debug_readiness(ctx, number):
+    # any number re-resolves everything first
+    if number is not None:
+        await ctx.defer()
+        await warm_up_resources()
+
+    await ctx.respond('\n'.join(readiness_report(resource_cache, config.timelines))[:2000])
+
+async def debug_force_error(ctx, number):
+    await ctx.respond('Forcing an error message')
+    math = 10 / 0  # noqa: F841
+
+debug_options = {
+    'cancel_job': debug_cancel_job,
+    'force_error': debug_force_error,
+    'jobs': debug_jobs,
+    'memory': debug_memory,
+    'metrics': debug_metrics,
+    'readiness': debug_readiness,
+    'routes': debug_routes,
+    'startup': debug_startup,
+    'version': debug_version,
+    'year_stats': debug_year_stats,
+}
+
+# --- Admin Options ---
+
+async def admin_force_year(ctx, timeline, number):
+    # finish an interrupted rollover before starting a new one
+    forced_year = timeline.rollover['year'] if timeline.rollover is not None else len(timeline.timestamps) + 1
+    _, year = get_year_status(timeline)
+
+    logger.info(f'Weap. Year forced by admin on "{timeline.name}": expected: {year} doing: {forced_year}')
+
+    async def force_year(job):
+        await job.report('Weap. No longer going to try my best, just forcing new year instead')
+
+        try:
+            await advance_year(timeline, forced_year)
+        finally:
+            # a failure leaves a checkpoint that the scheduler retries; a success moves the next boundary
+            schedule_timeline(timeline)
+
+        if timeline.rollover is not None or len(timeline.timestamps) < forced_year:
+            return f'Failed: Year {forced_year} PC did not complete; another rollover may be running'
 
-    elif option == 'force_error':
-        await ctx.respond('Forcing an error message')
-        math = 10 / 0  # noqa: F841
+        return f'Year {forced_year} PC has begun'
 
+    await run_as_job(ctx, f'force_year:{timeline.name}', force_year)
+
+async def admin_time_pause(ctx, timeline, number):
+    await ctx.respond('The passage of time has been stopped')
+    timeline.time_paused = True
+
+async def admin_time_resume(ctx, timeline, number):
+    move_epoch(timeline, timeline.epoch_length, resume=True)
+
+    await ctx.respond(f'The passage of time has been resumed with Attu epoch moved to **{timeline.epoch_year} PC** at **<t:{timeline.epoch_time}:f>**')
+
+async def admin_time_dilate(ctx, timeline, number):
+    if number is None:
+        await ctx.respond('Failed: Submit dilation amount (in days) in number field', ephemeral=True)
+        return
+
+    if timeline.time_paused:
+        timeline.set_epoch_length(number)
+        await ctx.respond(f'The passage of time has been set to **{timeline.epoch_length} days per year**')
     else:
-        await ctx.respond(f'Failed: Options are {", ".join(options)}', ephemeral=True)
+        move_epoch(timeline, number)
+        await ctx.respond(f'The passage of time has been set to **{timeline.epoch_length} days per year** with Attu epoch moved to **{timeline.epoch_year} PC** at **<t:{timeline.epoch_time}:f>**')
+
+async def admin_backfill_markers(ctx, timeline, number):
+    async def backfill(job):
+        found, missing = await backfill_markers(timeline)
+
+        lines = [f'Indexed {found} year markers across {len(timeline.lore_channels)} lore channels']
+        lines.extend(f'<#{channel_id}> is missing {len(years)} years (e.g. {", ".join(map(str, years[:5]))})' for channel_id, years in missing.items() if years)
+
+        return '\n'.join(lines)
+
+    await run_as_job(ctx, f'backfill_markers:{timeline.name}', backfill)
+
+admin_options = {
+    'backfill_markers': admin_backfill_markers,
+    'force_year': admin_force_year,
+    'time_dilate': admin_time_dilate,
+    'time_pause': admin_time_pause,
+    'time_resume': admin_time_resume,
+}
+
+# --- Owner Commands ---
+
+@bot.slash_command(guilds_only=True, default_member_permissions=Permissions.all())
+@discord.commands.option(name='option', required=True, description='Debug Option to Run', input_type=str)
+@discord.commands.option(name='number', required=False, description='Arguments', input_type=int)
+async def debug(ctx, option: str, number):
+    if ctx.user.id != config.bot_owner:
+        await ctx.respond("You're not my real dad!")
+        return
+
+    if option not in debug_options:
+        await ctx.respond(f'Failed: Options are {", ".join(sorted(debug_options))}', ephemeral=True)
+        return
+
+    await debug_options[option](ctx, number)
 
 @bot.slash_command(guilds_only=True, default_member_permissions=Permissions.all())
 @discord.commands.option(name='option', required=True, description='Admin Option to Run', input_type=str)
 @discord.commands.option(name='number', required=False, description='Arguments', input_type=int)
 async def admin(ctx, option: str, number):
-    options = ['force_year', 'time_dilate', 'time_pause', 'time_resume']
-    options.sort()
-
     if ctx.user.id != config.bot_owner:
         await ctx.respond("You're not my real dad!")
         return
 
-    if option == 'force_year':
-        forced_year = len(config.timestamps) + 1
-        _, year = get_year_status()
+    if option not in admin_options:
+        await ctx.respond(f'Failed: Options are {", ".join(sorted(admin_options))}', ephemeral=True)
+        return
 
-        logger.info(f'Weap. Year forced by admin: expected: {year} doing: {forced_year}')
-        await ctx.respond('Weap. No longer going to try my best, just forcing new year instead')
-        await advance_year(forced_year)
+    # every admin option acts on the timeline of the server it is used in
+    await admin_options[option](ctx, command_timeline(ctx), number)
 
-    elif option == 'time_pause':
-        await ctx.respond('The passage of time has been stopped')
-        config.time_paused = True
+@bot.slash_command(guilds_only=True, default_member_permissions=Permissions.all())
+@discord.commands.option(name='user', required=True, description='Wiki usernames or profile links, comma separated (case sensitive probably)', input_type=str)
+@discord.commands.option(name='reason', required=True, description='Reason for blocking', input_type=str)
+async def wiki_block(ctx, user, reason):
+    users = parse_users(user)
 
-    elif option == 'time_resume':
-        move_epoch(config.epoch_length)
+    if not users:
+        await ctx.respond('Failed: No wiki users given.', ephemeral=True)
+        return
 
-        await ctx.respond(f'The passage of time has been resumed with Attu epoch moved to **{config.epoch_year} PC** at **<t:{config.epoch_time}:f>**')
-        config.time_paused = False
+    reason = f'{reason} (on behalf of {ctx.user.global_name})'
 
-    elif option == 'time_dilate':
-        if number is None:
-            await ctx.respond('Failed: Submit dilation amount (in days) in number field', ephemeral=True)
-            return
+    # a spam wave can mean dozens of blocks; run them off the interaction and follow up with the summary
+    async def block_users(job):
+        done = []
 
-        if config.time_paused:
-            config.set_epoch_length(number)
-            await ctx.respond(f'The passage of time has been set to **{config.epoch_length} days per year**')
-        else:
-            move_epoch(number)
-            await ctx.respond(f'The passage of time has been set to **{config.epoch_length} days per year** with Attu epoch moved to **{config.epoch_year} PC** at **<t:{config.epoch_time}:f>**')
+        def on_result(name, res):
+            done.append(name)
+            job.progress = f'{len(done)} of {len(users)} processed'
 
+        wiki = get_wiki(config.wiki_api, config.wiki_user, config.wiki_key, timeout=config.wiki_timeout)
+        results = await wiki.block_many(users, reason, on_result=on_result)
+
+        lines = [f'Blocked {sum(1 for _, res in results if isinstance(res, dict) and "error" not in res)} of {len(users)} wiki users']
+
+        for name, res in results:
+            if isinstance(res, Exception):
+                lines.append(f'`{name}`: failed ({res!r})')
+            elif 'error' in res:
+                lines.append(f'`{name}`: failed ({res["error"].get("code")})')
+            else:
+                lines.append(f'`{name}`: blocked')
+
+        text = '\n'.join(lines)
+        return text if len(text) <= 2000 else text[:1996] + '\n...'
+
+    await run_as_job(ctx, 'wiki_block', block_users)
+
+# --- Resource Warm-up ---
+
+async def warm_up_resources():
+    # every guild, channel, thread and role at once, so a bad id shows up now rather than at the next rollover
+    results = await asyncio.gather(*(warm_up(bot, timeline) for timeline in config.timelines.values()))
+
+    resource_cache.clear()
+    resource_cache.update((resources.timeline, resources) for resources in results)
+
+    problems = [f'{resources.timeline}: {problem}' for resources in results for problem in resources.describe_problems()]
+
+    if problems:
+        send_to_error_log(ReadinessError('Timeline resources failed to resolve:\n' + '\n'.join(problems)))
     else:
-        await ctx.respond(f'Failed: Options are {", ".join(options)}', ephemeral=True)
+        logger.info(f'Resolved resources for {len(results)} timelines')
 
-@bot.slash_command(guilds_only=True, default_member_permissions=Permissions.all())
-@discord.commands.option(name='user', required=True, description='Wiki Username (case sensitive probably)', input_type=str)
-@discord.commands.option(name='reason', required=True, description='Reason for blocking', input_type=str)
-async def wiki_block(ctx, user, reason):
-    # TODO: allow sending a link to the user profile instead
-    await ctx.respond(f'Blocking user: {user}')
+def restart_warm_up():
+    # the settings behind a running warm-up may already be outdated, so start over
+    task = background_tasks.pop('warm_up', None)
+
+    if task is not None:
+        task.cancel()
+
+    start_background('warm_up', warm_up_resources)
+
+async def get_resources(timeline):
+    resources = resource_cache.get(timeline.name)
 
-    wiki = AttuWiki()
-    wiki.authenticate(config.wiki_user, config.wiki_key)
-    wiki.block(user, f'{reason} (on behalf of {ctx.user.global_name})')
+    # stale after a reload, and worth another try if anything was missing (it may have been fixed since)
+    if resources is None or resources.key != resource_key(timeline) or not resources.ready:
+        resources = resource_cache[timeline.name] = await warm_up(bot, timeline)
+
+    return resources
 
 # --- New Year Handling ---
 
-@tasks.loop(time=trigger_time)
-async def task_year_check():
-    logger.debug(f'task_year_check() Task triggered on {date.today()}, {datetime.now()}')
+def schedule_timeline(timeline, catch_up=False):
+    # the rollover fires at the exact boundary; called whenever the timeline may have moved
+    now = clock.time()
+    elapsed_days, year = get_year_status(timeline)
+    rollover = f'rollover:{timeline.name}'
+
+    for name in [name for name in scheduler.jobs if name.startswith(f'reminder:{timeline.name}:')]:
+        scheduler.cancel(name)
+
+    # a restart after trigger time on new year's day, or mid-rollover, picks up straight away
+    if catch_up and (timeline.rollover is not None or (not timeline.time_paused and elapsed_days % timeline.epoch_length == 0 and year > len(timeline.timestamps))):
+        scheduler.schedule(rollover, now, partial(scheduled_rollover, timeline))
+        return
+
+    # a failed step leaves its checkpoint behind; retry it with backoff rather than a whole year later
+    if timeline.rollover is not None:
+        # a running rollover reschedules once it is done
+        if timeline.rollover_lock.locked():
+            return
+
+        attempt = max(rollover_retries.get(timeline.name, 0), 1)
+        due = now + min(rollover_retry_delay * 2 ** (attempt - 1), rollover_retry_max)
+
+        # other changes to the timeline land here too; they keep an earlier retry rather than pushing it out
+        pending = scheduler.next_run(rollover)
+        scheduler.schedule(rollover, min(due, pending) if pending is not None else due, partial(scheduled_rollover, timeline))
+        return
+
+    rollover_retries.pop(timeline.name, None)
+
+    if timeline.time_paused:
+        scheduler.cancel(rollover)
+        return
+
+    next_year = get_next_year(timeline)
+    scheduler.schedule(rollover, next_year, partial(scheduled_rollover, timeline))
+
+    for hours in timeline.reminder_hours:
+        if next_year - hours * 3600 > now:
+            scheduler.schedule(f'reminder:{timeline.name}:{hours}', next_year - hours * 3600, partial(post_reminder, timeline, year + 1, next_year))
+
+def schedule_all(catch_up=False):
+    # every timeline shares the one scheduler; jobs of timelines dropped from the config go with them
+    for name in list(scheduler.jobs):
+        if name.split(':')[1] not in config.timelines:
+            scheduler.cancel(name)
+
+    for timeline in config.timelines.values():
+        schedule_timeline(timeline, catch_up=catch_up)
+
+async def scheduled_rollover(timeline):
+    logger.debug('scheduled_rollover() triggered for "%s" at %s', timeline.name, clock.time())
 
     try:
-        await check_for_new_year()
-    except Exception as error:
-        send_to_error_log(error)
+        await check_for_new_year(timeline)
+    except Exception:
+        # only a failed attempt moves the backoff on
+        rollover_retries[timeline.name] = rollover_retries.get(timeline.name, 0) + 1
+        raise
+    finally:
+        schedule_timeline(timeline)
+
+async def post_reminder(timeline, year, start_time):
+    resources = await get_resources(timeline)
+    await resources.channel(timeline.meta_chat_channel).send(f'Year {year} PC begins <t:{start_time}:R>')
+
+async def check_for_new_year(timeline):
+    resumed = timeline.rollover is not None
 
-async def check_for_new_year():
-    elapsed_days, year = get_year_status()
+    # a retry finishes the interrupted year first, then still checks whether the next one is due
+    if resumed:
+        logger.info(f'Resuming interrupted rollover of "{timeline.name}" to Year {timeline.rollover["year"]} PC')
+        await advance_year(timeline, timeline.rollover['year'])
 
-    if config.time_paused:
-        logger.info('The passage of time has been paused; skipping task')
+    elapsed_days, year = get_year_status(timeline)
 
-    elif elapsed_days % config.epoch_length != 0:
-        logger.info(f'Days Remaining Until Year {year + 1} PC: {config.epoch_length - (elapsed_days % config.epoch_length)}')
+    # the year to post comes from the store, so timestamps[n - 1] always stays the start of year n
+    due_year = len(timeline.timestamps) + 1
 
-    elif year < len(config.timestamps):
-        logger.error('Already enough years; was event manually triggered?')
+    if timeline.time_paused:
+        logger.info(f'The passage of time has been paused on "{timeline.name}"; skipping task')
+
+    elif elapsed_days % timeline.epoch_length != 0:
+        logger.info(f'Days Remaining Until Year {year + 1} PC on "{timeline.name}": {timeline.epoch_length - (elapsed_days % timeline.epoch_length)}')
+
+    elif year < due_year:
+        if not resumed:
+            logger.error(f'Already enough years on "{timeline.name}"; was event manually triggered?')
+
+    elif year > due_year:
+        raise RuntimeError(f'"{timeline.name}" is at Year {year} PC by the calendar but Year {due_year} PC was never posted; use /admin force_year to catch up')
 
     else:
-        await advance_year(year)
+        await advance_year(timeline, due_year)
+
+async def run_rollover_step(timeline, name, step):
+    # steps already recorded in the checkpoint are skipped so a rerun only redoes what is missing
+    steps = timeline.rollover['steps']
 
-async def advance_year(year):
-    guild = bot.get_guild(config.attu_guild)
+    if name not in steps:
+        with metrics.time('attubot_rollover_step_seconds', step=name, timeline=timeline.name):
+            result = await step()
+
+        # a step that stores state records itself in the same transaction
+        if name not in steps:
+            timeline.finish_rollover_step(name, result)
+
+    return timeline.rollover['steps'][name]
+
+async def run_rollover_stage(timeline, steps):
+    # independent steps run concurrently; py-cord queues each request behind its own per-route bucket
+    results = await asyncio.gather(*(run_rollover_step(timeline, name, step) for name, step in steps.items()), return_exceptions=True)
+    failed = { name: result for name, result in zip(steps, results, strict=True) if isinstance(result, Exception) }
+
+    for name, error in failed.items():
+        logger.error(f'Rollover step "{name}" of "{timeline.name}" failed: {error!r}')
+
+    return failed
+
+async def advance_year(timeline, year):
+    if timeline.rollover_lock.locked():
+        logger.error(f'Rollover of "{timeline.name}" already in progress; ignoring request for Year {year} PC')
+        return
 
-    logger.info(f'Happy New Year! Advancing to Year {year} PC')
+    async with timeline.rollover_lock:
+        resources = await get_resources(timeline)
 
-    # --- Lore Channel Year Markers ---
+        if timeline.rollover is None or timeline.rollover['year'] != year:
+            timeline.start_rollover(year)
 
-    year_str = format_year_line(year)
-    message_links = []
+        logger.info(f'Happy New Year! Advancing "{timeline.name}" to Year {year} PC')
 
-    for channel_id in config.lore_channels:
-        channel = guild.get_channel(channel_id)
-        message = await channel.send(year_str)
-        message_links.append(message.jump_url)
+        year_str = format_year_line(year)
 
-    # Save timestamp to config file
-    config.add_timestamp(message.id)
+        # --- Lore Channel Year Markers ---
 
-    # --- Increase Year VC ---
+        def send_year_marker(channel_id):
+            async def step():
+                message = await resources.channel(channel_id).send(year_str)
+                return message.id
 
-    year_vc = guild.get_channel(config.year_vc)
-    await year_vc.edit(name=f'Current Year: {year} PC')
+            return step
 
-    # --- Edit Wiki ---
+        # --- Increase Year VC ---
 
-    wiki = AttuWiki()
-    wiki.authenticate(config.wiki_user, config.wiki_key)
+        async def rename_year_vc():
+            year_vc = resources.channel(timeline.year_vc)
+            await year_vc.edit(name=f'Current Year: {year} PC')
+            return True
 
-    text = wiki.get_page_contents(config.wiki_page)
-    updated_page = re.sub(r'Current Year: [\d]+ PC', f'Current Year: {year} PC', text, flags=re.IGNORECASE)
+        # --- Edit Wiki ---
 
-    wiki.edit(config.wiki_page, updated_page, f'Bumped to Year {year} PC')
+        async def edit_wiki():
+            wiki = get_wiki(config.wiki_api, config.wiki_user, config.wiki_key, timeout=config.wiki_timeout)
 
-    # --- Make Announcement ---
+            await wiki.replace_in_page(timeline.wiki_page, r'Current Year: [\d]+ PC', f'Current Year: {year} PC', f'Bumped to Year {year} PC', flags=re.IGNORECASE)
+            return True
 
-    channel = guild.get_channel(config.announce_channel)
-    await channel.send(f'<@&{config.announce_role}> Year {year} PC. (weap)')
+        # --- Make Announcement ---
 
-    # --- Send Year Links Message ---
+        async def make_announcement():
+            channel = resources.channel(timeline.announce_channel)
+            message = await channel.send(f'<@&{timeline.announce_role}> Year {year} PC. (weap)')
+            return message.id
 
-    doom_forum = guild.get_channel(config.doom_forum)
-    thread = doom_forum.get_thread(config.year_link_thread)
-    await thread.send(year_str + '\n' + '\n'.join(message_links))
+        failed = await run_rollover_stage(timeline, {
+            **{ f'lore_{channel_id}': send_year_marker(channel_id) for channel_id in timeline.lore_channels },
+            'year_vc': rename_year_vc,
+            'wiki': edit_wiki,
+            'announcement': make_announcement,
+        })
+
+        # --- Steps Depending on the Year Markers ---
+
+        markers = [timeline.rollover['steps'].get(f'lore_{channel_id}') for channel_id in timeline.lore_channels]
+
+        if None not in markers:
+            message_links = [f'https://discord.com/channels/{timeline.guild_id}/{channel_id}/{message_id}' for channel_id, message_id in zip(timeline.lore_channels, markers, strict=True)]
+
+            # Save timestamp and the marker in every lore channel
+            async def save_timestamp():
+                timeline.record_year(year, markers[-1], ((year, channel_id, message_id) for channel_id, message_id in zip(timeline.lore_channels, markers, strict=True)), step='timestamp')
+                return True
+
+            # --- Send Year Links Message ---
+
+            async def send_year_links():
+                thread = resources.channel(timeline.year_link_thread)
+                message = await thread.send(year_str + '\n' + '\n'.join(message_links))
+                return message.id
+
+            failed.update(await run_rollover_stage(timeline, {
+                'timestamp': save_timestamp,
+                'year_links': send_year_links,
+            }))
+
+        else:
+            # a lore channel added by a reload mid-rollover has no marker yet; the retry posts it
+            failed.update({ f'lore_{channel_id}': RuntimeError(f'No Year {year} PC marker in lore channel {channel_id}') for channel_id, marker in zip(timeline.lore_channels, markers, strict=True) if marker is None and f'lore_{channel_id}' not in failed })
+
+        if failed:
+            logger.error(f'Rollover of "{timeline.name}" to Year {year} PC incomplete; rerun with /admin force_year to resume')
+            raise next(iter(failed.values()))
+
+        timeline.clear_rollover()
+        logger.info(f'Rollover of "{timeline.name}" to Year {year} PC complete')
+
+# --- Year Marker Index ---
+
+marker_pattern = re.compile(r'Year (\d+) PC')
+
+async def scan_for_markers(channel, after=None):
+    # oldest first so a year posted twice keeps its original marker
+    found = {}
+
+    async for message in channel.history(limit=None, after=after, oldest_first=True):
+        match = marker_pattern.search(message.content)
+
+        if match is not None and message.content == format_year_line(int(match.group(1))):
+            found.setdefault(int(match.group(1)), message.id)
+
+    return found
+
+async def backfill_markers(timeline, concurrency=3):
+    # every lore channel is paged through at once, bounded so the history route is not hammered
+    resources = await get_resources(timeline)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    # nothing before the year 1 marker (less a day of slack) can be a marker
+    after = discord.Object(id=timeline.timestamps[0] - (86400000 << 22)) if timeline.timestamps else None
+
+    async def scan(channel_id):
+        async with semaphore:
+            return channel_id, await scan_for_markers(resources.channel(channel_id), after=after)
+
+    results = await asyncio.gather(*(scan(channel_id) for channel_id in timeline.lore_channels))
+    rows = [(year, channel_id, message_id) for channel_id, found in results for year, message_id in found.items()]
+
+    timeline.add_markers(rows)
+    logger.info(f'Backfilled {len(rows)} year markers for "{timeline.name}"')
+
+    missing = { channel_id: [year for year in range(1, len(timeline.timestamps) + 1) if (year, channel_id) not in timeline.markers] for channel_id in timeline.lore_channels }
+    return len(rows), missing
+
+# --- Command Sync ---
+
+def get_command_fingerprint():
+    schema = sorted((command.to_dict() for command in bot.pending_application_commands), key=lambda command: command['name'])
+    return hashlib.sha256(json.dumps([bot.application_id, schema], sort_keys=True, default=str).encode()).hexdigest()
+
+def bind_command_ids(command_ids):
+    # mirrors what bot.sync_commands() does with the ids discord hands back, minus the round trips
+    if any(command.name not in command_ids for command in bot.pending_application_commands):
+        return False
+
+    for command in bot.pending_application_commands:
+        command.id = command_ids[command.name]
+        bot._application_commands[command.id] = command
+
+    return True
+
+async def sync_commands():
+    fingerprint = get_command_fingerprint()
+    command_ids = json.loads(config.store.get('command_ids') or '{}')
+
+    if config.store.get('command_fingerprint') == fingerprint and bind_command_ids(command_ids):
+        logger.info('Slash commands unchanged since last sync; skipping')
+        return
+
+    logger.info('Slash commands changed; syncing with discord')
+    await bot.sync_commands()
+
+    command_ids = { command.name: command.id for command in bot.application_commands if command.id is not None }
+    config.store.set(command_fingerprint=fingerprint, command_ids=json.dumps(command_ids))
 
 # --- Events ---
 
+@bot.event
+async def on_connect():
+    startup.mark('login')
+    await sync_commands()
+    startup.mark('command sync')
+
+@bot.event
+async def on_unknown_application_command(interaction):
+    # cached ids went stale (commands deleted or re-created elsewhere); force a full sync
+    logger.warn(f'Unknown application command {interaction.data.get("name")}; forcing command sync')
+
+    config.store.delete('command_fingerprint')
+    await sync_commands()
+
 @bot.event
 async def on_ready():
     perms = '207952'
@@ -377,16 +950,45 @@ async def on_ready():
     logger.info(f'Logged in as {bot.user} (ID: {bot.user.id})!')
     logger.info(f'Add to a server:\n\thttps://discordapp.com/oauth2/authorize?client_id={bot.application_id}&scope=bot&permissions={perms}')
 
-    task_year_check.start()
+    error_collector.start()
+    jobs.start()
+    start_background('scheduler', scheduler.run)
+    start_background('config_watch', config.watch)
+
+    watchdog.start()
+    start_background('watchdog', watchdog.heartbeat)
+
+    if config.health_port is not None:
+        watchdog.serve(config.metrics_host, config.health_port)
+
+    if config.metrics_port is not None:
+        start_background('metrics_server', lambda: serve(config.metrics_host, config.metrics_port))
+
+    # scheduled before anything that can fail, so no timeline is left without its rollover; also resumes an interrupted one
+    schedule_all(catch_up=True)
+
+    # a reconnect replaces the cached guilds and channels, so this runs on every on_ready; a rollover due meanwhile resolves its own
+    await warm_up_resources()
+    startup.mark('resource warm-up')
+
+    startup.finish()
 
 @bot.event
 async def on_message(message):
-    if message.channel.id == config.activity_channel and message.content.startswith('[DoomBot]'):
-        await message.add_reaction('💖')
+    await router.dispatch(message)
+
+@bot.before_invoke
+async def before_command(ctx):
+    ctx.started = perf_counter()
+
+@bot.after_invoke
+async def after_command(ctx):
+    if hasattr(ctx, 'started'):
+        metrics.observe('attubot_command_seconds', perf_counter() - ctx.started, command=ctx.command.qualified_name)
 
 @bot.event
 async def on_application_command_error(ctx, error):
-    await send_to_error_log(error)
+    send_to_error_log(error)
 
 """
 @bot.event
@@ -394,10 +996,53 @@ async def on_message(message):
     logger.info(f'Message from {message.author}: {message.content}')
 """
 
+# --- Background Tasks ---
+
+def start_background(name, coroutine_function):
+    # on_ready fires again after every reconnect, so only start what is not already running
+    task = background_tasks.get(name)
+
+    if task is None or task.done():
+        background_tasks[name] = asyncio.create_task(coroutine_function(), name=name)
+
+# --- Message Routes ---
+
+async def react_to_doombot(message):
+    await message.add_reaction('💖')
+
+def register_routes():
+    router.clear()
+    router.register(config.activity_channel, react_to_doombot, prefix='[DoomBot]')
+
+# --- Instrumentation ---
+
+def instrument_discord_http():
+    # time every REST call py-cord makes, labelled by route template rather than concrete ids
+    request = bot.http.request
+
+    async def timed_request(route, **kwargs):
+        with metrics.time('attubot_discord_request_seconds', method=route.method, route=route.path):
+            return await request(route, **kwargs)
+
+    bot.http.request = timed_request
+    count_discord_rate_limits()
+
 # --- Trigger Function ---
 
 def start_bot_loop():
     config.load_from_file()
+    register_routes()
+    startup.mark('config load')
+
+    instrument_discord_http()
+
+    # settings changed on disk are swapped in live; rebuild whatever was derived from the old ones
+    config.reload_listeners.append(register_routes)
+    config.reload_listeners.append(schedule_all)
+    config.reload_listeners.append(restart_warm_up)
+
+    # dilating, pausing, resuming or advancing time moves the next boundary
+    config.change_listeners.append(schedule_timeline)
 
     logger.info('Starting bot...')
     bot.run(config.bot_token)
@@ -0,0 +1,88 @@
+"""
+AttuBot - Error log aggregation
+Author(s): @jhnhnck <john@jhnhnck.com>
+
+This file is licensed under the Apache License, Version 2.0; See LICENSE for full text.
+"""
+
+import asyncio
+import traceback
+from types import SimpleNamespace
+
+from attubot.logging import get_logger
+
+logger = get_logger(__name__)
+
+message_limit = 2000
+
+class ErrorCollector:
+    def __init__(self, send, window=60):
+        self.send = send
+        self.window = window
+        self.pending = {}
+        self.task = None
+        self._wake = asyncio.Event()
+
+    @staticmethod
+    def fingerprint(error):
+        # same exception type raised from the same line counts as a repeat
+        frames = traceback.extract_tb(error.__traceback__)
+        location = f'{frames[-1].filename}:{frames[-1].lineno}' if frames else 'unknown'
+
+        return type(error).__name__, location
+
+    def record(self, error):
+        key = self.fingerprint(error)
+        entry = self.pending.get(key)
+
+        if entry is None:
+            tb_str = ''.join(traceback.format_tb(error.__traceback__))
+            entry = self.pending[key] = SimpleNamespace(name=key[0], location=key[1], error=str(error), traceback=tb_str, count=0)
+
+            logger.error(lambda: f'{error!r}\n{tb_str}')
+
+        entry.count += 1
+        self._wake.set()
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    async def run(self):
+        # the first error goes out right away, then at most one summary per window
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+
+            await self.flush()
+            await asyncio.sleep(self.window)
+
+    def render(self, entries):
+        entries = sorted(entries, key=lambda entry: entry.count, reverse=True)
+        text = ''
+
+        for entry in entries:
+            repeats = f' (x{entry.count})' if entry.count > 1 else ''
+            text += f'**{entry.name}: {entry.error}**{repeats}\n`{entry.location}`\n'
+
+        # tracebacks only for as many entries as still fit in one message
+        for entry in entries:
+            block = f'```\n{entry.traceback}```\n'
+
+            if len(text) + len(block) > message_limit:
+                break
+
+            text += block
+
+        return text[:message_limit]
+
+    async def flush(self):
+        pending, self.pending = self.pending, {}
+
+        if not pending:
+            return
+
+        try:
+            await self.send(self.render(pending.values()))
+        except Exception as error:
+            logger.error(f'Failed to post {len(pending)} error(s) to the error log: {error!r}')
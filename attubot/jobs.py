@@ -0,0 +1,149 @@
+"""
+AttuBot - Background job queue for slow commands
+Author(s): @jhnhnck <john@jhnhnck.com>
+
+This file is licensed under the Apache License, Version 2.0; See LICENSE for full text.
+"""
+
+import asyncio
+import itertools
+import time
+from collections import deque
+
+from attubot.logging import get_logger
+
+logger = get_logger(__name__)
+
+class JobQueueFull(Exception):
+    pass
+
+class Job:
+    def __init__(self, job_id, name, run, notify=None, owner=None):
+        self.id = job_id
+        self.name = name
+        self.run = run
+        self.notify = notify
+        self.owner = owner
+        self.status = 'queued'
+        self.progress = None
+        self.result = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.task = None
+
+    @property
+    def active(self):
+        return self.status in ('queued', 'running')
+
+    async def report(self, text):
+        # shown in /debug jobs and posted as a followup; set progress directly for silent updates
+        self.progress = text
+        await self._notify(text)
+
+    async def _notify(self, text):
+        if self.notify is None:
+            return
+
+        try:
+            await self.notify(text)
+        except Exception as error:
+            logger.warn(f'Job #{self.id} ({self.name}) could not post an update: {error!r}')
+
+class JobQueue:
+    def __init__(self, workers=2, max_queued=20, history=20, on_error=None):
+        self.worker_count = workers
+        self.max_queued = max_queued
+        self.on_error = on_error
+        self.queue = asyncio.Queue()
+        self.jobs = {}
+        self.finished = deque(maxlen=history)
+        self.counter = itertools.count(1)
+        self.workers = []
+
+    def start(self):
+        self.workers = [worker for worker in self.workers if not worker.done()]
+
+        while len(self.workers) < self.worker_count:
+            self.workers.append(asyncio.create_task(self._work(), name=f'job_worker_{len(self.workers)}'))
+
+    def submit(self, name, run, notify=None, owner=None):
+        # run(job) is awaited on a worker; its return value is posted through notify when it finishes
+        if self.queue.qsize() >= self.max_queued:
+            raise JobQueueFull(f'{self.queue.qsize()} jobs already waiting')
+
+        job = Job(next(self.counter), name, run, notify=notify, owner=owner)
+        self.jobs[job.id] = job
+        self.queue.put_nowait(job)
+
+        logger.info(f'Queued job #{job.id} ({name})')
+        return job
+
+    def cancel(self, job_id):
+        job = self.jobs.get(job_id)
+
+        if job is None or not job.active:
+            return False
+
+        if job.task is not None:
+            job.task.cancel()
+        else:
+            # still waiting; the worker skips it when it comes up
+            self._finish(job, 'cancelled')
+
+        return True
+
+    def active(self):
+        return [job for job in self.jobs.values() if job.active]
+
+    def recent(self):
+        return list(self.finished)
+
+    def _finish(self, job, status, result=None):
+        job.status = status
+        job.result = result
+        job.finished = time.time()
+
+        self.jobs.pop(job.id, None)
+        self.finished.append(job)
+
+    async def _work(self):
+        while True:
+            job = await self.queue.get()
+
+            try:
+                if job.status == 'queued':
+                    await self._execute(job)
+            finally:
+                self.queue.task_done()
+
+    async def _execute(self, job):
+        job.status = 'running'
+        job.started = time.time()
+        job.task = asyncio.create_task(job.run(job), name=f'job_{job.id}')
+
+        try:
+            result = await job.task
+        except asyncio.CancelledError:
+            self._finish(job, 'cancelled')
+
+            # the worker itself is being shut down, not just this job
+            if asyncio.current_task().cancelling():
+                raise
+
+            await job._notify(f'Job #{job.id} ({job.name}) was cancelled')
+            return
+        except Exception as error:
+            self._finish(job, 'failed', repr(error))
+            await job._notify(f'Failed: Job #{job.id} ({job.name}) raised {error!r}')
+
+            if self.on_error is not None:
+                self.on_error(error)
+
+            return
+
+        self._finish(job, 'done', result)
+        logger.info(f'Job #{job.id} ({job.name}) finished in {job.finished - job.started:.1f}s')
+
+        if result is not None:
+            await job._notify(result)
@@ -5,8 +5,65 @@ Author(s): @jhnhnck <john@jhnhnck.com>
 This file is licensed under the Apache License, Version 2.0; See LICENSE for full text.
 """
 
+import atexit
+import contextlib
+import json
+import queue
 import sys
-from os import environ
+import threading
+import time
+from os import environ, getenv
+
+levels = { 'trace': 0, 'debug': 10, 'info': 20, 'warn': 30, 'error': 40, 'fatal': 50 }
+
+def resolve_level():
+    level = getenv('LOG_LEVEL', '').lower()
+
+    if level in levels:
+        return levels[level]
+
+    return levels['trace'] if 'DEBUG' in environ else levels['info']
+
+# resolved once at startup; the environment is not consulted again
+log_level = resolve_level()
+log_json = getenv('LOG_FORMAT', '').lower() == 'json'
+
+# --- Background Writer ---
+
+records = queue.SimpleQueue()
+
+def format_record(created, class_name, level, message, args):
+    # messages are only rendered here, off the event loop, and only for enabled levels
+    try:
+        if callable(message):
+            message = message()
+        elif args:
+            message = message % args
+    except Exception as error:
+        message = f'{message!r} (formatting failed: {error!r})'
+
+    if log_json:
+        return json.dumps({ 'time': created, 'logger': class_name, 'level': level, 'message': str(message) })
+
+    return f'{class_name} > {level}. {message}'
+
+def write_records():
+    while (record := records.get()) is not None:
+        stream = sys.stderr if levels[record[2]] >= levels['warn'] else sys.stdout
+
+        # a closed or broken stream must not take the writer thread down with it
+        with contextlib.suppress(Exception):
+            print(format_record(*record), file=stream, flush=records.empty())
+
+def stop_writer():
+    records.put(None)
+    writer.join(timeout=2)
+
+writer = threading.Thread(target=write_records, name='attubot-logger', daemon=True)
+writer.start()
+atexit.register(stop_writer)
+
+# --- Logger Class ---
 
 class Logger:
     class_name = 'attubot.???'
@@ -14,31 +71,34 @@ class Logger:
     def __init__(self, class_name):
         self.class_name = class_name
 
-    def _stdout(self, level, message):
-        print(f'{self.class_name} > {level}. {message}')
+        # disabled levels are swapped for a no-op so hot paths pay almost nothing for them
+        for level, value in levels.items():
+            if value < log_level:
+                setattr(self, level, self._discard)
+
+    def _discard(self, message, *args):
+        pass
 
-    def _stderr(self, level, message):
-        print(f'{self.class_name} > {level}. {message}', file=sys.stderr)
+    def _log(self, level, message, args):
+        records.put((time.time(), self.class_name, level, message, args))
 
-    def trace(self, message):
-        if 'DEBUG' in environ:
-            self._stdout('trace', message)
+    def trace(self, message, *args):
+        self._log('trace', message, args)
 
-    def debug(self, message):
-        if 'DEBUG' in environ:
-            self._stdout('debug', message)
+    def debug(self, message, *args):
+        self._log('debug', message, args)
 
-    def info(self, message):
-        self._stdout('info', message)
+    def info(self, message, *args):
+        self._log('info', message, args)
 
-    def warn(self, message):
-        self._stderr('warn', message)
+    def warn(self, message, *args):
+        self._log('warn', message, args)
 
-    def error(self, message):
-        self._stderr('error', message)
+    def error(self, message, *args):
+        self._log('error', message, args)
 
-    def fatal(self, message):
-        self._stderr('fatal', message)
+    def fatal(self, message, *args):
+        self._log('fatal', message, args)
 
 def get_logger(class_name):
     return Logger(class_name)
@@ -0,0 +1,80 @@
+"""
+AttuBot - Memory usage reporting
+Author(s): @jhnhnck <john@jhnhnck.com>
+
+This file is licensed under the Apache License, Version 2.0; See LICENSE for full text.
+"""
+
+import tracemalloc
+from pathlib import Path
+
+from attubot.logging import get_logger
+
+logger = get_logger(__name__)
+
+def format_bytes(size):
+    for unit in ('B', 'KiB', 'MiB'):
+        if abs(size) < 1024:
+            return f'{size:.1f} {unit}' if unit != 'B' else f'{size} B'
+
+        size /= 1024
+
+    return f'{size:.1f} GiB'
+
+def read_rss():
+    # (resident, peak resident) in bytes as the kernel reports them; None off linux
+    try:
+        lines = Path('/proc/self/status').read_text().splitlines()
+    except OSError:
+        return None
+
+    fields = dict(line.split(':', 1) for line in lines if ':' in line)
+    return tuple(int(fields[name].split()[0]) * 1024 for name in ('VmRSS', 'VmHWM'))
+
+def start_tracing(frames=1):
+    # tracing costs memory and time on every allocation, so it only runs when asked for
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+        logger.info(f'Started tracing allocations ({frames} frames)')
+
+def stop_tracing():
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+        logger.info('Stopped tracing allocations')
+
+def top_allocations(limit=10):
+    # (file:line, bytes, blocks) of the live allocations, biggest first
+    snapshot = tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    ])
+
+    rows = []
+
+    for stat in snapshot.statistics('lineno')[:limit]:
+        frame = stat.traceback[0]
+        rows.append((f'{"/".join(Path(frame.filename).parts[-2:])}:{frame.lineno}', stat.size, stat.count))
+
+    return rows
+
+def memory_report(bot, mode, limit=10):
+    lines = [f'**Memory** (mode: {mode})']
+    rss = read_rss()
+
+    if rss is not None:
+        lines.append(f'RSS: {format_bytes(rss[0])} (peak {format_bytes(rss[1])})')
+
+    guilds = bot.guilds
+    lines.append(f'Cached: {len(guilds)} guilds, {sum(len(guild.channels) for guild in guilds)} channels, {sum(len(guild.members) for guild in guilds)} members, {len(bot.cached_messages)} messages')
+
+    if not tracemalloc.is_tracing():
+        lines.append('Allocation tracing is off; `/debug memory <frames>` starts it, `/debug memory 0` stops it')
+        return lines
+
+    traced, peak = tracemalloc.get_traced_memory()
+    lines.append(f'**Top Allocation Sites** (traced {format_bytes(traced)}, peak {format_bytes(peak)})')
+    lines.extend(f'`{site}`: {format_bytes(size)} in {count} blocks' for site, size, count in top_allocations(limit))
+
+    return lines
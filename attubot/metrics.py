@@ -0,0 +1,158 @@
+"""
+AttuBot - Metrics collection and Prometheus endpoint
+Author(s): @jhnhnck <john@jhnhnck.com>
+
+This file is licensed under the Apache License, Version 2.0; See LICENSE for full text.
+"""
+
+import asyncio
+import logging
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from attubot.logging import get_logger
+
+logger = get_logger(__name__)
+
+buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(buckets, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+        self.max = max(self.max, seconds)
+
+def format_labels(labels, **extra):
+    pairs = [*labels, *extra.items()]
+    return '{' + ','.join(f'{key}="{value}"' for key, value in pairs) + '}' if pairs else ''
+
+class Metrics:
+    def __init__(self):
+        # name -> labels (sorted tuple of pairs) -> value
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.descriptions = {}
+
+    def describe(self, name, text):
+        self.descriptions[name] = text
+
+    def observe(self, name, seconds, **labels):
+        series = self.histograms.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+
+        if key not in series:
+            series[key] = Histogram()
+
+        series[key].observe(seconds)
+
+    def inc(self, name, amount=1, **labels):
+        series = self.counters.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        series[key] = series.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        self.gauges.setdefault(name, {})[tuple(sorted(labels.items()))] = value
+
+    @contextmanager
+    def time(self, name, **labels):
+        started = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def render(self):
+        lines = []
+
+        for kind, families in (('counter', self.counters), ('gauge', self.gauges)):
+            for name, series in families.items():
+                if name in self.descriptions:
+                    lines.append(f'# HELP {name} {self.descriptions[name]}')
+
+                lines.append(f'# TYPE {name} {kind}')
+                lines.extend(f'{name}{format_labels(labels)} {value}' for labels, value in series.items())
+
+        for name, series in self.histograms.items():
+            if name in self.descriptions:
+                lines.append(f'# HELP {name} {self.descriptions[name]}')
+
+            lines.append(f'# TYPE {name} histogram')
+
+            for labels, histogram in series.items():
+                cumulative = 0
+
+                for bound, count in zip([*buckets, '+Inf'], histogram.counts, strict=True):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{format_labels(labels, le=bound)} {cumulative}')
+
+                lines.append(f'{name}_sum{format_labels(labels)} {histogram.sum}')
+                lines.append(f'{name}_count{format_labels(labels)} {histogram.count}')
+
+        return '\n'.join(lines) + '\n'
+
+    def summary(self, name):
+        # (labels, count, average seconds, max seconds) per series, slowest first
+        rows = [(dict(labels), histogram.count, histogram.sum / histogram.count, histogram.max) for labels, histogram in self.histograms.get(name, {}).items() if histogram.count]
+        return sorted(rows, key=lambda row: row[2], reverse=True)
+
+metrics = Metrics()
+
+metrics.describe('attubot_command_seconds', 'Slash command handler latency')
+metrics.describe('attubot_discord_request_seconds', 'Discord REST request latency by route')
+metrics.describe('attubot_wiki_request_seconds', 'MediaWiki API request latency by action')
+metrics.describe('attubot_rollover_step_seconds', 'New year rollover step latency')
+metrics.describe('attubot_rate_limited_total', 'Rate limit responses by service')
+
+# --- Rate Limit Counting ---
+
+class RateLimitCounter(logging.Handler):
+    # py-cord reports 429s through stdlib logging rather than an event
+    def emit(self, record):
+        if 'rate limited' in record.getMessage().lower():
+            metrics.inc('attubot_rate_limited_total', service='discord')
+
+def count_discord_rate_limits():
+    logging.getLogger('discord.http').addHandler(RateLimitCounter(logging.WARNING))
+
+# --- HTTP Endpoint ---
+
+routes = {
+    '/metrics': lambda: (200, 'text/plain; version=0.0.4', metrics.render()),
+}
+
+async def handle_request(reader, writer):
+    try:
+        request = await asyncio.wait_for(reader.readline(), timeout=5)
+        parts = request.decode('latin-1').split()
+        path = parts[1].split('?')[0] if len(parts) >= 2 else ''
+
+        # drain headers; nothing in them matters here
+        while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b'\r\n', b'\n', b''):
+            pass
+
+        status, content_type, body = routes[path]() if path in routes else (404, 'text/plain', 'not found\n')
+        payload = body.encode()
+
+        writer.write(f'HTTP/1.1 {status} {"OK" if status == 200 else "Error"}\r\nContent-Type: {content_type}\r\nContent-Length: {len(payload)}\r\nConnection: close\r\n\r\n'.encode() + payload)
+        await writer.drain()
+    except (TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+async def serve(host, port):
+    server = await asyncio.start_server(handle_request, host, port)
+    logger.info(f'Serving metrics on http://{host}:{port}/metrics')
+
+    async with server:
+        await server.serve_forever()
@@ -0,0 +1,173 @@
+"""
+AttuBot - Resolves and validates the discord resources a timeline posts to
+Author(s): @jhnhnck <john@jhnhnck.com>
+
+This file is licensed under the Apache License, Version 2.0; See LICENSE for full text.
+"""
+
+import asyncio
+import time
+
+import discord
+
+from attubot.logging import get_logger
+
+logger = get_logger(__name__)
+
+# the permission each kind of channel needs for the rollover to go through
+required_permissions = {
+    'lore channel': 'send_messages',
+    'meta chat': 'send_messages',
+    'announcements': 'send_messages',
+    'year vc': 'manage_channels',
+    'doom forum': None,
+    'year link thread': 'send_messages_in_threads',
+}
+
+class ReadinessError(Exception):
+    pass
+
+def resource_key(timeline):
+    # everything a warm-up resolved; when a reload changes any of it the cached handles are stale
+    return (timeline.guild_id, tuple(timeline.lore_channels), timeline.meta_chat_channel, timeline.announce_channel, timeline.year_vc, timeline.doom_forum, timeline.year_link_thread, timeline.announce_role)
+
+class Resources:
+    def __init__(self, timeline):
+        self.timeline = timeline.name
+        self.key = resource_key(timeline)
+        self.guild = None
+        self.channels = {}
+        self.role = None
+
+        # id -> (kind, reason)
+        self.problems = {}
+        self.checked_at = time.time()
+        self.seconds = 0.0
+
+    @property
+    def ready(self):
+        return not self.problems
+
+    def channel(self, channel_id):
+        channel = self.channels.get(channel_id)
+
+        if channel is None:
+            kind, reason = self.problems.get(channel_id, ('channel', 'not resolved'))
+            raise LookupError(f'{kind} {channel_id} of "{self.timeline}" is unavailable: {reason}')
+
+        return channel
+
+    def describe_problems(self):
+        return [f'{kind} `{resource_id}`: {reason}' for resource_id, (kind, reason) in self.problems.items()]
+
+def failure_reason(error):
+    # whatever goes wrong with one resource is recorded against it; the rest still resolve
+    if isinstance(error, ReadinessError):
+        return str(error)
+
+    if isinstance(error, discord.HTTPException):
+        return f'cannot fetch ({type(error).__name__})'
+
+    return f'cannot resolve ({error!r})'
+
+async def fetch_channel(guild, timeline, channel_id, kind):
+    channel = guild.get_channel(channel_id)
+
+    # archived threads drop out of the cache, so the forum only knows the active ones
+    if channel is None and kind == 'year link thread':
+        forum = guild.get_channel(timeline.doom_forum)
+        channel = forum.get_thread(channel_id) if hasattr(forum, 'get_thread') else None
+
+    channel = channel or await guild.fetch_channel(channel_id)
+
+    if kind == 'year link thread':
+        if not isinstance(channel, discord.Thread):
+            raise ReadinessError(f'not a thread ({type(channel).__name__})')
+
+        if channel.archived:
+            if getattr(channel, 'locked', False):
+                raise ReadinessError('archived and locked')
+
+            await channel.edit(archived=False)
+            logger.info(f'Unarchived year link thread {channel_id} of "{timeline.name}"')
+
+    return channel
+
+async def warm_up(bot, timeline):
+    resources = Resources(timeline)
+    started = time.perf_counter()
+
+    try:
+        guild = bot.get_guild(timeline.guild_id) or await bot.fetch_guild(timeline.guild_id)
+    except Exception as error:
+        resources.problems[timeline.guild_id] = ('guild', failure_reason(error))
+        return resources
+
+    resources.guild = guild
+    me = getattr(guild, 'me', None)
+
+    def check(channel, kind):
+        permission = required_permissions[kind]
+
+        # without a member cache (lean mode) our own member can be missing; discord will still refuse at send time
+        if me is not None and permission is not None and not getattr(channel.permissions_for(me), permission):
+            resources.problems[channel.id] = (kind, f'missing {permission} permission')
+
+    async def resolve(channel_id, kind):
+        try:
+            channel = await fetch_channel(guild, timeline, channel_id, kind)
+            check(channel, kind)
+        except Exception as error:
+            resources.problems[channel_id] = (kind, failure_reason(error))
+            return
+
+        resources.channels[channel_id] = channel
+
+    async def resolve_role():
+        role = guild.get_role(timeline.announce_role)
+
+        try:
+            role = role or next((role for role in await guild.fetch_roles() if role.id == timeline.announce_role), None)
+        except Exception as error:
+            resources.problems[timeline.announce_role] = ('announce role', failure_reason(error))
+            return
+
+        if role is None:
+            resources.problems[timeline.announce_role] = ('announce role', 'not found')
+            return
+
+        # the announcement pings the role; an unmentionable role is posted but nobody is notified
+        if not getattr(role, 'mentionable', True) and me is not None and not me.guild_permissions.mention_everyone:
+            resources.problems[role.id] = ('announce role', 'not mentionable')
+
+        resources.role = role
+
+    kinds = {
+        **{ channel_id: 'lore channel' for channel_id in timeline.lore_channels },
+        timeline.meta_chat_channel: 'meta chat',
+        timeline.announce_channel: 'announcements',
+        timeline.year_vc: 'year vc',
+        timeline.doom_forum: 'doom forum',
+        timeline.year_link_thread: 'year link thread',
+    }
+
+    await asyncio.gather(resolve_role(), *(resolve(channel_id, kind) for channel_id, kind in kinds.items()))
+    resources.seconds = time.perf_counter() - started
+
+    return resources
+
+def readiness_report(resources, timelines):
+    lines = []
+
+    for name, timeline in timelines.items():
+        entry = resources.get(name)
+
+        if entry is None or entry.key != resource_key(timeline):
+            lines.append(f'**Timeline: {name}**: not warmed up')
+            continue
+
+        status = 'ready' if entry.ready else f'{len(entry.problems)} problems'
+        lines.append(f'**Timeline: {name}**: {status} ({len(entry.channels)} channels resolved in {entry.seconds * 1000:.0f} ms, <t:{int(entry.checked_at)}:R>)')
+        lines.extend(entry.describe_problems())
+
+    return lines
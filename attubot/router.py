@@ -0,0 +1,68 @@
+"""
+AttuBot - Channel-keyed message routing
+Author(s): @jhnhnck <john@jhnhnck.com>
+
+This file is licensed under the Apache License, Version 2.0; See LICENSE for full text.
+"""
+
+from attubot.logging import get_logger
+
+logger = get_logger(__name__)
+
+class Route:
+    def __init__(self, channel_id, handler, *, guild_id=None, author_id=None, prefix=None):
+        self.name = handler.__name__
+        self.channel_id = channel_id
+        self.handler = handler
+        self.guild_id = guild_id
+        self.author_id = author_id
+        self.prefix = prefix
+        self.hits = 0
+
+    def matches(self, message):
+        if self.guild_id is not None and (message.guild is None or message.guild.id != self.guild_id):
+            return False
+        if self.author_id is not None and message.author.id != self.author_id:
+            return False
+
+        return self.prefix is None or message.content.startswith(self.prefix)
+
+class MessageRouter:
+    def __init__(self):
+        # channel id -> routes watching it; unwatched channels are a single failed dict lookup
+        self.routes = {}
+        self.dropped = 0
+
+    def register(self, channel_id, handler, *, name=None, **filters):
+        # filters (guild_id, author_id, prefix) go straight to Route, which rejects anything else
+        route = Route(channel_id, handler, **filters)
+        route.name = name or route.name
+        self.routes.setdefault(channel_id, []).append(route)
+
+        logger.debug('Registered message route "%s" on channel %s', route.name, channel_id)
+        return route
+
+    def route(self, channel_id, **kwargs):
+        def decorator(handler):
+            self.register(channel_id, handler, **kwargs)
+            return handler
+
+        return decorator
+
+    def clear(self):
+        self.routes = {}
+
+    async def dispatch(self, message):
+        routes = self.routes.get(message.channel.id)
+
+        if routes is None:
+            self.dropped += 1
+            return
+
+        for route in routes:
+            if route.matches(message):
+                route.hits += 1
+                await route.handler(message)
+
+    def stats(self):
+        return [route for routes in self.routes.values() for route in routes]
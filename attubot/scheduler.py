@@ -0,0 +1,106 @@
+"""
+AttuBot - Timer heap scheduler
+Author(s): @jhnhnck <john@jhnhnck.com>
+
+This file is licensed under the Apache License, Version 2.0; See LICENSE for full text.
+"""
+
+import asyncio
+import contextlib
+import heapq
+import itertools
+from types import SimpleNamespace
+
+from attubot.logging import get_logger
+
+logger = get_logger(__name__)
+
+class Scheduler:
+    # long sleeps are cut short so wall clock jumps (suspend, ntp) are noticed
+    max_sleep = 3600
+
+    def __init__(self, get_time, on_error=None):
+        self.get_time = get_time
+        self.on_error = on_error
+        self.heap = []
+        self.jobs = {}
+        self.counter = itertools.count()
+
+        # the loop only keeps weak references to tasks, so running jobs are held here until they finish
+        self.tasks = set()
+        self._wake = asyncio.Event()
+
+    def schedule(self, name, when, callback):
+        # scheduling an existing name replaces it; the old heap entry is skipped when it surfaces
+        job = SimpleNamespace(name=name, when=when, callback=callback, seq=next(self.counter))
+        self.jobs[name] = job
+
+        heapq.heappush(self.heap, (when, job.seq, name))
+        self._wake.set()
+
+        logger.debug('Scheduled "%s" at %s', name, when)
+
+    def cancel(self, name):
+        if self.jobs.pop(name, None) is not None:
+            self._wake.set()
+
+    def next_run(self, name):
+        job = self.jobs.get(name)
+        return job.when if job is not None else None
+
+    def next_due(self):
+        job = self._peek()
+        return job.when if job is not None else None
+
+    def _peek(self):
+        # discard heap entries for jobs that were cancelled or rescheduled
+        while self.heap:
+            _, seq, name = self.heap[0]
+            job = self.jobs.get(name)
+
+            if job is not None and job.seq == seq:
+                return job
+
+            heapq.heappop(self.heap)
+
+        return None
+
+    def _pop_due(self):
+        job = self._peek()
+
+        if job is None or job.when > self.get_time():
+            return None
+
+        heapq.heappop(self.heap)
+        del self.jobs[job.name]
+
+        return job
+
+    async def _fire(self, job):
+        try:
+            await job.callback()
+        except Exception as error:
+            logger.error(f'Scheduled job "{job.name}" failed: {error!r}')
+
+            if self.on_error is not None:
+                self.on_error(error)
+
+    async def run_pending(self):
+        # fire everything already due, in order; lets simulations drive the scheduler with a virtual clock
+        while (job := self._pop_due()) is not None:
+            await self._fire(job)
+
+    async def run(self):
+        while True:
+            self._wake.clear()
+
+            while (job := self._pop_due()) is not None:
+                task = asyncio.create_task(self._fire(job), name=f'scheduled:{job.name}')
+                self.tasks.add(task)
+                task.add_done_callback(self.tasks.discard)
+
+            when = self.next_due()
+            delay = min(when - self.get_time(), self.max_sleep) if when is not None else self.max_sleep
+
+            with contextlib.suppress(TimeoutError):
+                await asyncio.wait_for(self._wake.wait(), timeout=max(delay, 0))
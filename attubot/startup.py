@@ -0,0 +1,43 @@
+"""
+AttuBot - Startup timing
+Author(s): @jhnhnck <john@jhnhnck.com>
+
+This file is licensed under the Apache License, Version 2.0; See LICENSE for full text.
+"""
+
+import time
+
+from attubot.logging import get_logger
+
+logger = get_logger(__name__)
+
+class StartupTimer:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.last = self.started
+        self.stages = {}
+        self.ready = False
+
+    def mark(self, stage):
+        # each stage is timed from the end of the previous one; repeats (reconnects) are ignored
+        now = time.perf_counter()
+
+        if stage not in self.stages and not self.ready:
+            self.stages[stage] = now - self.last
+
+        self.last = now
+
+    def finish(self):
+        if not self.ready:
+            self.mark('on_ready')
+            self.ready = True
+
+            logger.info('Startup timings:\n' + '\n'.join(f'\t{line}' for line in self.report()))
+
+    def report(self):
+        lines = [f'{stage}: {seconds * 1000:.0f} ms' for stage, seconds in self.stages.items()]
+        lines.append(f'time to ready: {sum(self.stages.values()) * 1000:.0f} ms')
+
+        return lines
+
+startup = StartupTimer()
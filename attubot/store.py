@@ -0,0 +1,157 @@
+"""
+AttuBot - Persistent state storage
+Author(s): @jhnhnck <john@jhnhnck.com>
+
+This file is licensed under the Apache License, Version 2.0; See LICENSE for full text.
+"""
+
+import sqlite3
+from contextlib import contextmanager
+from pathlib import Path
+
+from attubot.logging import get_logger
+
+logger = get_logger(__name__)
+
+schema = """
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value
+);
+
+CREATE TABLE IF NOT EXISTS timeline_state (
+    timeline TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value,
+    PRIMARY KEY (timeline, key)
+);
+
+CREATE TABLE IF NOT EXISTS timestamps (
+    timeline TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    PRIMARY KEY (timeline, year)
+);
+
+CREATE TABLE IF NOT EXISTS markers (
+    timeline TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    channel_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    PRIMARY KEY (timeline, year, channel_id)
+);
+
+CREATE TABLE IF NOT EXISTS rollover_steps (
+    timeline TEXT NOT NULL,
+    step TEXT NOT NULL,
+    result,
+    PRIMARY KEY (timeline, step)
+);
+"""
+
+# the timeline described by the top level of the config
+legacy_timeline = 'default'
+
+class StateStore:
+    def __init__(self, file_name):
+        self.file_name = Path(file_name).resolve()
+
+        logger.info(f'Opening state store "{self.file_name}"')
+
+        # autocommit mode; multi-field updates go through transaction()
+        self.db = sqlite3.connect(self.file_name, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=FULL')
+
+        # executescript() would commit early, so the statements run one by one inside the transaction
+        with self.transaction():
+            for statement in schema.split(';'):
+                self.db.execute(statement)
+
+    def close(self):
+        self.db.close()
+
+    @contextmanager
+    def transaction(self):
+        self.db.execute('BEGIN IMMEDIATE')
+
+        try:
+            yield self
+        except BaseException:
+            self.db.execute('ROLLBACK')
+            raise
+
+        self.db.execute('COMMIT')
+
+    # --- Bot-wide State ---
+
+    def get(self, key, default=None):
+        row = self.db.execute('SELECT value FROM state WHERE key = ?', (key,)).fetchone()
+        return row[0] if row is not None else default
+
+    def set(self, **values):
+        self.db.executemany('INSERT INTO state (key, value) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value', values.items())
+
+    def delete(self, key):
+        self.db.execute('DELETE FROM state WHERE key = ?', (key,))
+
+    def timeline(self, name):
+        return TimelineStore(self, name)
+
+class TimelineStore:
+    # the slice of the store belonging to one timeline
+    def __init__(self, store, name):
+        self.store = store
+        self.name = name
+        self.db = store.db
+
+    def transaction(self):
+        return self.store.transaction()
+
+    @property
+    def is_empty(self):
+        return self.db.execute('SELECT COUNT(*) FROM timeline_state WHERE timeline = ?', (self.name,)).fetchone()[0] == 0
+
+    def get(self, key, default=None):
+        row = self.db.execute('SELECT value FROM timeline_state WHERE timeline = ? AND key = ?', (self.name, key)).fetchone()
+        return row[0] if row is not None else default
+
+    def set(self, **values):
+        self.db.executemany('INSERT INTO timeline_state (timeline, key, value) VALUES (?, ?, ?) ON CONFLICT (timeline, key) DO UPDATE SET value = excluded.value', ((self.name, key, value) for key, value in values.items()))
+
+    def delete(self, key):
+        self.db.execute('DELETE FROM timeline_state WHERE timeline = ? AND key = ?', (self.name, key))
+
+    def timestamps(self):
+        return [row[0] for row in self.db.execute('SELECT message_id FROM timestamps WHERE timeline = ? ORDER BY year', (self.name,))]
+
+    def set_timestamp(self, year: int, message_id: int):
+        self.db.execute('INSERT INTO timestamps (timeline, year, message_id) VALUES (?, ?, ?) ON CONFLICT (timeline, year) DO UPDATE SET message_id = excluded.message_id', (self.name, year, message_id))
+
+    def markers(self):
+        return { (year, channel_id): message_id for year, channel_id, message_id in self.db.execute('SELECT year, channel_id, message_id FROM markers WHERE timeline = ?', (self.name,)) }
+
+    def set_markers(self, rows):
+        # rows of (year, channel_id, message_id)
+        self.db.executemany('INSERT OR REPLACE INTO markers (timeline, year, channel_id, message_id) VALUES (?, ?, ?, ?)', ((self.name, *row) for row in rows))
+
+    def rollover_steps(self):
+        return dict(self.db.execute('SELECT step, result FROM rollover_steps WHERE timeline = ?', (self.name,)))
+
+    def set_rollover_step(self, step, result):
+        self.db.execute('INSERT OR REPLACE INTO rollover_steps (timeline, step, result) VALUES (?, ?, ?)', (self.name, step, result))
+
+    def clear_rollover_steps(self):
+        self.db.execute('DELETE FROM rollover_steps WHERE timeline = ?', (self.name,))
+
+    def migrate(self, epoch, timestamps, rollover=None):
+        # one-time import of the mutable state that used to live in the json config
+        logger.info(f'Migrating epoch and {len(timestamps)} timestamps for timeline "{self.name}" into "{self.store.file_name}"')
+
+        with self.transaction():
+            self.set(epoch_time=int(epoch['time']), epoch_year=epoch['year'], epoch_length=epoch['length'], paused=int(epoch.get('paused', False)))
+            self.db.executemany('INSERT OR REPLACE INTO timestamps (timeline, year, message_id) VALUES (?, ?, ?)', ((self.name, year, message_id) for year, message_id in enumerate(timestamps, start=1)))
+
+            if rollover is not None:
+                self.set(rollover_year=rollover['year'])
+                self.db.executemany('INSERT OR REPLACE INTO rollover_steps (timeline, step, result) VALUES (?, ?, ?)', ((self.name, step, result) for step, result in rollover['steps'].items()))
@@ -0,0 +1,222 @@
+"""
+AttuBot - Timelines (one calendar per campaign)
+Author(s): @jhnhnck <john@jhnhnck.com>
+
+This file is licensed under the Apache License, Version 2.0; See LICENSE for full text.
+"""
+
+import asyncio
+from datetime import time
+from types import SimpleNamespace
+
+from attubot.choices import ChoiceIndex
+from attubot.years import YearIndex
+
+id_settings = ['guild_id', 'year_vc', 'announce_channel', 'doom_forum', 'year_link_thread', 'meta_chat_channel', 'announce_role']
+
+def check_ids(settings, names, where=None):
+    # discord ids must be plain integers or every lookup silently misses
+    for name in names:
+        if type(settings[name]) is not int:
+            prefix = f'{where}: ' if where is not None else ''
+            raise ValueError(f'{prefix}{name} must be an integer id, got {settings[name]!r}')
+
+def parse_trigger_time(text):
+    # "HH:MM" in the bot's local timezone
+    hour, minute = (int(part) for part in text.split(':'))
+    return time(hour, minute)
+
+def parse_timeline(name, raw, guild_id):
+    settings = {
+        'guild_id': guild_id,
+
+        'year_vc': raw['channels']['year_vc'],
+        'announce_channel': raw['channels']['announcements'],
+        'doom_forum': raw['channels']['doom_forum'],
+        'year_link_thread': raw['channels']['year_links'],
+        'meta_chat_channel': raw['channels']['meta_chat'],
+        'lore_channels': raw['channels']['lore_channels'],
+
+        'announce_role': raw['roles']['leaders'],
+
+        'wiki_page': raw['wiki']['page'],
+        'trigger_time': parse_trigger_time(raw.get('trigger_time', '17:00')),
+        'reminder_hours': raw.get('reminders', {}).get('hours', []),
+    }
+
+    check_ids(settings, id_settings, name)
+
+    # only read on the first start, but a timeline added later without one could never be loaded
+    epoch = raw.get('epoch')
+
+    if not isinstance(epoch, dict) or any(type(epoch.get(key)) not in (int, float) for key in ('time', 'year', 'length')):
+        raise ValueError(f'{name}: epoch must have a numeric time, year and length, got {epoch!r}')
+
+    if not settings['lore_channels'] or any(type(channel) is not int for channel in settings['lore_channels']):
+        raise ValueError(f'{name}: lore_channels must be a non-empty list of integer ids, got {settings["lore_channels"]!r}')
+
+    # /link_year's default channel; the fourth lore channel (#lore-news) unless configured
+    settings['default_channel'] = raw['channels'].get('default_lore', settings['lore_channels'][min(3, len(settings['lore_channels']) - 1)])
+
+    if any(type(hours) not in (int, float) or hours <= 0 for hours in settings['reminder_hours']):
+        raise ValueError(f'{name}: reminders.hours must be a list of positive numbers, got {settings["reminder_hours"]!r}')
+
+    return settings
+
+class Timeline:
+    def __init__(self, name, store, on_change=None):
+        self.name = name
+        self.store = store
+        self.on_change = on_change
+        self.revision = 0
+
+        # derived from the state below and rebuilt whenever revision moves on
+        self.year_cache = SimpleNamespace(revision=None, index=None)
+        self.version_cache = SimpleNamespace(revision=None, expires=0, version=0)
+        self.choices = SimpleNamespace(years=ChoiceIndex(), linkable=ChoiceIndex(), channels=ChoiceIndex())
+        self.rollover_lock = asyncio.Lock()
+
+    def apply(self, settings):
+        # the owner notifies listeners once everything is applied, so only invalidate the caches here
+        for name, value in settings.items():
+            setattr(self, name, value)
+
+        self.revision += 1
+
+    @property
+    def channel_ids(self):
+        return { *self.lore_channels, self.meta_chat_channel, self.announce_channel, self.year_vc, self.doom_forum, self.year_link_thread }
+
+    # --- State ---
+
+    def load_state(self, raw=None, migrated=False):
+        # mutable state (epoch, pause flag, timestamps, rollover progress) lives in the state store, not the json file
+        if self.store.is_empty:
+            # the json stopped being updated at migration; importing it again would roll the calendar back
+            if migrated:
+                raise RuntimeError(f'State of timeline "{self.name}" is missing from "{self.store.store.file_name}" but was already migrated out of the config, whose epoch and timestamps are stale; restore the state file (is ./data mounted?) or remove "{self.name}" from migrated_timelines to import the config anyway')
+
+            self.store.migrate(raw['epoch'], raw.get('timestamps', []), raw.get('rollover'))
+
+        self.epoch_time = self.store.get('epoch_time')
+        self.epoch_year = self.store.get('epoch_year')
+        self.epoch_length = self.store.get('epoch_length')
+        self._time_paused = bool(self.store.get('paused'))
+        self.timestamps = self.store.timestamps()
+        self.markers = self.store.markers()
+
+        rollover_year = self.store.get('rollover_year')
+        self._rollover = { 'year': rollover_year, 'steps': self.store.rollover_steps() } if rollover_year is not None else None
+
+        self._changed()
+
+    def _changed(self):
+        # bumped on every load or state change so derived caches know when to rebuild
+        self.revision += 1
+
+        if self.on_change is not None:
+            self.on_change(self)
+
+    def record_year(self, year: int, timestamp, rows, step):
+        # the year's timestamp and markers land in one transaction with the rollover step, so a resumed rollover never stores them twice
+        if year > len(self.timestamps) + 1:
+            raise ValueError(f'Year {year} PC of "{self.name}" would leave a gap after Year {len(self.timestamps)} PC')
+
+        rows = list(rows)
+
+        with self.store.transaction():
+            self.store.set_markers(rows)
+            self.store.set_timestamp(year, timestamp)
+            self.store.set_rollover_step(step, True)
+
+        if year <= len(self.timestamps):
+            self.timestamps[year - 1] = timestamp
+        else:
+            self.timestamps.append(timestamp)
+
+        self.markers.update(((year, channel_id), message_id) for year, channel_id, message_id in rows)
+        self._rollover['steps'][step] = True
+        self._changed()
+
+    def add_markers(self, rows):
+        # rows of (year, channel_id, message_id): the exact year marker posted in each lore channel
+        rows = list(rows)
+
+        with self.store.transaction():
+            self.store.set_markers(rows)
+
+        self.markers.update(((year, channel_id), message_id) for year, channel_id, message_id in rows)
+        self._changed()
+
+    def set_epoch(self, time, year: int, length: int | None = None, paused: bool | None = None):
+        values = { 'epoch_time': int(time), 'epoch_year': year }
+
+        if length is not None:
+            values['epoch_length'] = length
+        if paused is not None:
+            values['paused'] = int(paused)
+
+        with self.store.transaction():
+            self.store.set(**values)
+
+        self.epoch_time = int(time)
+        self.epoch_year = year
+        self.epoch_length = length if length is not None else self.epoch_length
+        self._time_paused = paused if paused is not None else self._time_paused
+        self._changed()
+
+    def set_epoch_length(self, length: int):
+        self.store.set(epoch_length=length)
+        self.epoch_length = length
+        self._changed()
+
+    @property
+    def rollover(self):
+        return self._rollover
+
+    def start_rollover(self, year: int):
+        with self.store.transaction():
+            self.store.clear_rollover_steps()
+            self.store.set(rollover_year=year)
+
+        self._rollover = { 'year': year, 'steps': {} }
+
+    def finish_rollover_step(self, step, result):
+        self.store.set_rollover_step(step, result)
+        self._rollover['steps'][step] = result
+
+    def clear_rollover(self):
+        with self.store.transaction():
+            self.store.clear_rollover_steps()
+            self.store.delete('rollover_year')
+
+        self._rollover = None
+
+    @property
+    def time_paused(self):
+        return self._time_paused
+
+    @time_paused.setter
+    def time_paused(self, value: bool):
+        self.store.set(paused=int(value))
+        self._time_paused = value
+        self._changed()
+
+    # --- Calendar ---
+
+    def year_index(self, now):
+        # rebuilt only when the timeline has changed since the last build
+        if self.year_cache.revision != self.revision:
+            self.year_cache.index = YearIndex((self.epoch_time, self.epoch_year, self.epoch_length), self.timestamps, self.trigger_time, paused=self.time_paused, now=now)
+            self.year_cache.revision = self.revision
+
+        return self.year_cache.index
+
+    def version(self, now):
+        # changes on every mutation and whenever the current year or the new year's eve window flips
+        if self.version_cache.revision != self.revision or now >= self.version_cache.expires:
+            self.version_cache.expires = self.year_index(now).next_change(now)
+            self.version_cache.revision = self.revision
+            self.version_cache.version += 1
+
+        return self.version_cache.version
@@ -0,0 +1,187 @@
+"""
+AttuBot - Event loop stall detection
+Author(s): @jhnhnck <john@jhnhnck.com>
+
+This file is licensed under the Apache License, Version 2.0; See LICENSE for full text.
+"""
+
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace, TracebackType
+
+from attubot.logging import get_logger
+from attubot.metrics import metrics
+
+logger = get_logger(__name__)
+
+metrics.describe('attubot_event_loop_stalls_total', 'Times a single callback blocked the event loop past the stall threshold')
+metrics.describe('attubot_event_loop_stall_seconds', 'How long the event loop stayed blocked per stall')
+metrics.describe('attubot_event_loop_lag_seconds', 'How late the event loop woke a sleeping task (latest sample)')
+metrics.describe('attubot_event_loop_delay_seconds', 'How late the event loop woke a sleeping task')
+
+class LoopStall(Exception):
+    pass
+
+class HealthHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        status, content_type, body = self.server.watchdog.http_health() if self.path == '/health' else (404, 'text/plain', 'not found\n')
+        payload = body.encode()
+
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        # docker polls this every few seconds; nothing worth logging
+        pass
+
+def frame_traceback(frame):
+    # a real traceback (outermost first) for a frame that is still running, so stalls group and render like any other error
+    tb = None
+
+    while frame is not None:
+        tb = TracebackType(tb, frame, frame.f_lasti, frame.f_lineno)
+        frame = frame.f_back
+
+    return tb
+
+class LoopWatchdog:
+    # heartbeat period, seconds between stacks sent to the error log, and the lag that makes the bot unhealthy once it lasts
+    interval = 0.1
+    cooldown = 300
+    unhealthy_lag = 1.0
+    unhealthy_after = 30
+
+    def __init__(self, threshold=1.0, on_stall=None, history=20):
+        self.threshold = threshold
+        self.on_stall = on_stall
+
+        self.loop = None
+        self.loop_thread = None
+        self.thread = None
+        self.server = None
+
+        # written by the heartbeat on the loop, read by the watchdog thread
+        self.beat = time.monotonic()
+        self.lag = 0.0
+        self.high_since = None
+
+        self.last_report = None
+        self.stalls = deque(maxlen=history)
+
+    def start(self):
+        # called on the loop; the thread outlives reconnects, so it is only started once
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread = threading.get_ident()
+        self.beat = time.monotonic()
+
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self._watch, name='loop_watchdog', daemon=True)
+            self.thread.start()
+
+    async def heartbeat(self):
+        # the one loop lag sampler: /health reads it here, /debug metrics and /metrics through the gauge
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+
+            self.beat = time.monotonic()
+            self.lag = max(self.beat - started - self.interval, 0.0)
+
+            metrics.set('attubot_event_loop_lag_seconds', self.lag)
+            metrics.observe('attubot_event_loop_delay_seconds', self.lag)
+
+            # lag that stays high (not one slow callback) is what makes the bot unhealthy
+            if self.lag < self.unhealthy_lag:
+                self.high_since = None
+            elif self.high_since is None:
+                self.high_since = started
+
+    # --- Watchdog Thread ---
+
+    def _watch(self):
+        stall = None
+
+        while True:
+            time.sleep(self.interval)
+            beat = self.beat
+
+            if stall is None and time.monotonic() - beat >= self.threshold:
+                stall = self._capture(beat)
+
+            elif stall is not None and beat != stall.beat:
+                # the loop is back; its callbacks (metrics, error log) have to run on it
+                stall.duration = beat - stall.beat - self.interval
+                self.loop.call_soon_threadsafe(self._finish, stall)
+                stall = None
+
+    def _capture(self, beat):
+        frame = sys._current_frames().get(self.loop_thread)
+        now = time.monotonic()
+
+        # only the first stall in each cooldown window gets a stack in the logs and the error log
+        report = self.last_report is None or now - self.last_report >= self.cooldown
+        stall = SimpleNamespace(beat=beat, started=time.time(), duration=None, report=report, tb=frame_traceback(frame) if frame is not None else None, location='unknown')
+
+        if stall.tb is not None:
+            innermost = traceback.extract_tb(stall.tb)[-1]
+            stall.location = f'{innermost.filename}:{innermost.lineno}'
+
+        if report:
+            self.last_report = now
+            logger.warn(lambda: f'Event loop blocked for over {self.threshold}s in {stall.location}\n' + ''.join(traceback.format_tb(stall.tb)))
+        else:
+            logger.warn(f'Event loop blocked for over {self.threshold}s in {stall.location}')
+
+        del frame
+        return stall
+
+    def _finish(self, stall):
+        metrics.inc('attubot_event_loop_stalls_total')
+        metrics.observe('attubot_event_loop_stall_seconds', stall.duration)
+
+        self.stalls.append(SimpleNamespace(started=stall.started, duration=stall.duration, location=stall.location))
+        logger.info(f'Event loop recovered after a {stall.duration:.2f}s stall in {stall.location}')
+
+        if stall.report and self.on_stall is not None:
+            error = LoopStall(f'Event loop blocked for {stall.duration:.2f}s')
+            self.on_stall(error.with_traceback(stall.tb))
+
+    # --- Health ---
+
+    def health(self):
+        # (healthy, reason)
+        now = time.monotonic()
+
+        if self.loop is None:
+            return False, 'watchdog not started'
+
+        if now - self.beat >= self.threshold:
+            return False, f'event loop blocked for {now - self.beat:.1f}s'
+
+        if self.high_since is not None and now - self.high_since >= self.unhealthy_after:
+            return False, f'event loop lag {self.lag * 1000:.0f} ms for {now - self.high_since:.0f}s'
+
+        return True, f'ok (event loop lag {self.lag * 1000:.1f} ms)'
+
+    def http_health(self):
+        healthy, reason = self.health()
+        return 200 if healthy else 503, 'text/plain', reason + '\n'
+
+    def serve(self, host, port):
+        # answered from its own thread, so a blocked loop gets a 503 instead of a timeout
+        if self.server is not None:
+            return
+
+        self.server = ThreadingHTTPServer((host, port), HealthHandler)
+        self.server.watchdog = self
+
+        threading.Thread(target=self.server.serve_forever, name='health_server', daemon=True).start()
+        logger.info(f'Serving health checks on http://{host}:{port}/health')
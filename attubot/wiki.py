@@ -5,28 +5,182 @@ Author(s): @jhnhnck <john@jhnhnck.com>
 This file is licensed under the Apache License, Version 2.0; See LICENSE for full text.
 """
 
-import requests  # noqa: I001
-# from requests_toolbelt.utils import dump
+import asyncio
+import re
+from types import SimpleNamespace
+from urllib.parse import unquote
+
+import aiohttp
 
 from attubot.logging import get_logger
+from attubot.metrics import metrics
+
 logger = get_logger(__name__)
 
+# error codes that mean the cached login or csrf token has gone stale
+session_errors = ('assertuserfailed', 'assertbotfailed', 'notloggedin')
+token_errors = ('badtoken',)
+
+# the wiki is asking us to slow down; back off and try the same request again
+throttle_errors = ('ratelimited', 'maxlag')
+
+heading = re.compile(r'^(={1,6})[^=\n].*?\1[ \t]*$', re.MULTILINE)
+
+user_link = re.compile(r'(?:User:|Special:Contributions/)([^/?#&]+)', re.IGNORECASE)
+
+def find_section(text, position):
+    # section number mediawiki assigns to the text at `position` (0 is the lead)
+    return len(heading.findall(text, 0, position))
+
+def parse_users(text):
+    # comma separated usernames or profile/contributions links, deduplicated in order
+    users = []
+
+    for entry in text.split(','):
+        match = user_link.search(entry)
+        user = unquote(match.group(1)).replace('_', ' ') if match else entry
+
+        if user.strip() and user.strip() not in users:
+            users.append(user.strip())
+
+    return users
+
+class WikiError(Exception):
+    def __init__(self, code, info):
+        super().__init__(f'{code}: {info}')
+        self.code = code
+        self.info = info
+
 class AttuWiki:
     api_endpoint = 'https://attuproject.org/api.php'
-    session = requests.Session()
     token = ''
 
-    def _get_csrf(self):
-        res = self.session.get(self.api_endpoint, params={ 'action': 'query', 'meta': 'tokens', 'format': 'json' })
-        return res.json()['query']['tokens']['csrftoken']
+    # writes ask the wiki to refuse them while its replicas lag, then retry with backoff
+    maxlag = 5
+    throttle_retries = 4
+
+    def __init__(self, api_endpoint=None, timeout=30, connect_timeout=10, pool_size=4):
+        self.api_endpoint = api_endpoint or self.api_endpoint
+        self.timeout = aiohttp.ClientTimeout(total=timeout, connect=connect_timeout)
+        self.pool_size = pool_size
+        self.session = None
+
+        self.credentials = None
+        self.csrf = None
+        self.logged_in = False
+        self.login_count = 0
+
+        # page -> section holding every match (None when they span sections) and the last revision we saw or wrote
+        self.page_cache = {}
+        self._login_lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def _get_session(self):
+        # keep-alive pool shared by every call made through this client
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60)
+
+            # unsafe cookie jar so login cookies also stick to bare IP endpoints (local api.php stand-ins)
+            self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout, cookie_jar=aiohttp.CookieJar(unsafe=True))
+
+        return self.session
+
+    @staticmethod
+    def _encode(fields):
+        # mediawiki treats any present value as true, so drop false flags entirely
+        return { key: ('1' if value is True else str(value)) for key, value in fields.items() if value is not None and value is not False }
+
+    @staticmethod
+    def _observe(res):
+        if res.get('error', {}).get('code') in throttle_errors:
+            metrics.inc('attubot_rate_limited_total', service='wiki')
+
+        return res
+
+    async def _get(self, params):
+        with metrics.time('attubot_wiki_request_seconds', action=params['action']):
+            async with self._get_session().get(self.api_endpoint, params=self._encode(params)) as res:
+                return self._observe(await res.json(content_type=None))
+
+    async def _post(self, data):
+        with metrics.time('attubot_wiki_request_seconds', action=data['action']):
+            async with self._get_session().post(self.api_endpoint, data=self._encode(data)) as res:
+                return self._observe(await res.json(content_type=None))
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+
+        self.session = None
+        self.csrf = None
+        self.logged_in = False
+
+    async def _get_csrf(self):
+        if self.csrf is None:
+            res = await self._get({ 'action': 'query', 'meta': 'tokens', 'format': 'json' })
+            self.csrf = res['query']['tokens']['csrftoken']
+
+        return self.csrf
+
+    async def _ensure_login(self, stale_login=None):
+        async with self._login_lock:
+            # another caller already refreshed the session while we waited
+            if self.logged_in and self.login_count != stale_login:
+                return
+
+            if self.credentials is None:
+                raise WikiError('nocredentials', 'authenticate() or set_credentials() must be called first')
+
+            await self.authenticate(*self.credentials)
+
+    async def _write(self, data):
+        # steady state is a single POST: cached login + cached csrf, validated server-side by assert=user
+        if not self.logged_in:
+            await self._ensure_login()
+
+        refreshed = False
+
+        for attempt in range(self.throttle_retries + 1):
+            login = self.login_count
+            res = await self._post({ **data, 'token': await self._get_csrf(), 'assert': 'user', 'maxlag': self.maxlag })
+            code = res.get('error', {}).get('code')
+
+            if code in throttle_errors and attempt < self.throttle_retries:
+                delay = max(res['error'].get('lag', 0), min(2 ** attempt, 30))
+                logger.info(f'Wiki asked us to back off ({code}); retrying in {delay}s')
 
-    # def _debug(self, response):
-    #     data = dump.dump_all(response)
-    #     logger.debug(data.decode('utf-8'))
+                await asyncio.sleep(delay)
+                continue
 
-    def authenticate(self, user, key):
-        res = self.session.get(self.api_endpoint, params={ 'action': 'query', 'meta': 'tokens', 'type': 'login', 'format': 'json' })
-        self.token = res.json()['query']['tokens']['logintoken']
+            if refreshed or (code not in session_errors and code not in token_errors):
+                break
+
+            refreshed = True
+
+            logger.info(f'Wiki session went stale ({code}); refreshing')
+            self.csrf = None
+
+            if code in session_errors:
+                await self._ensure_login(stale_login=login)
+
+        return res
+
+    def set_credentials(self, user, key):
+        if self.credentials != (user, key):
+            self.credentials = (user, key)
+            self.logged_in = False
+            self.csrf = None
+
+    async def authenticate(self, user, key):
+        self.set_credentials(user, key)
+
+        res = await self._get({ 'action': 'query', 'meta': 'tokens', 'type': 'login', 'format': 'json' })
+        self.token = res['query']['tokens']['logintoken']
 
         data = {
             'action': 'login',
@@ -36,33 +190,103 @@ class AttuWiki:
             'format': 'json',
         }
 
-        res = self.session.post(self.api_endpoint, data=data)
-        logger.debug(res.text)
+        res = await self._post(data)
+        logger.debug(res)
+
+        if res.get('login', {}).get('result') != 'Success':
+            raise WikiError('loginfailed', res.get('login', {}).get('reason', res))
+
+        # tokens are tied to the session, so a new login always invalidates the cached one
+        self.logged_in = True
+        self.login_count += 1
+        self.csrf = None
+
+    async def get_revision(self, page_name, section=None):
+        params = {
+            'action': 'query',
+            'prop': 'revisions',
+            'titles': page_name,
+            'rvprop': 'ids|timestamp|content',
+            'rvslots': 'main',
+            'rvsection': section,
+            'formatversion': 2,
+            'format': 'json',
+        }
+
+        res = await self._get(params)
+        revision = res['query']['pages'][0]['revisions'][0]
+
+        return SimpleNamespace(text=revision['slots']['main']['content'], revid=revision['revid'], timestamp=revision['timestamp'], section=section)
+
+    async def _locate(self, page_name, pattern, flags):
+        cached = self.page_cache.get(page_name)
+
+        # usual case: every match sat in one section and nobody has edited the page since we last saw it
+        if cached is not None and cached.section is not None:
+            revision = await self.get_revision(page_name, cached.section)
+
+            if revision.revid == cached.revid and re.search(pattern, revision.text, flags):
+                return revision
+
+        # first run, matches in several sections, or someone else edited; read the whole page and map the matches again
+        revision = await self.get_revision(page_name)
+        sections = { find_section(revision.text, match.start()) for match in re.finditer(pattern, revision.text, flags) }
 
-    def get_page_contents(self, page_name):
-        res = self.session.get(self.api_endpoint, params={ 'action': 'parse', 'page': page_name, 'prop': 'wikitext', 'formatversion': 2 , 'format': 'json' })
-        return res.json()['parse']['wikitext']
+        if sections:
+            self.page_cache[page_name] = SimpleNamespace(section=sections.pop() if len(sections) == 1 else None, revid=revision.revid)
+        else:
+            self.page_cache.pop(page_name, None)
 
-    def edit(self, page_name, text, reason):
-        csrf = self._get_csrf()
+        return revision
 
+    async def replace_in_page(self, page_name, pattern, replacement, reason, flags=0):
+        for attempt in range(2):
+            revision = await self._locate(page_name, pattern, flags)
+            updated = re.sub(pattern, replacement, revision.text, flags=flags)
+
+            if updated == revision.text:
+                logger.info(f'Wiki page "{page_name}" already up to date; skipping edit')
+                return None
+
+            res = await self.edit(page_name, updated, reason, base=revision)
+            code = res.get('error', {}).get('code')
+
+            # someone edited between our read and write; drop the cache and redo it against their revision
+            if code == 'editconflict' and attempt == 0:
+                logger.info(f'Edit conflict on wiki page "{page_name}"; retrying')
+                self.page_cache.pop(page_name, None)
+                continue
+
+            if code is not None:
+                raise WikiError(code, res['error'].get('info', ''))
+
+            if page_name in self.page_cache:
+                self.page_cache[page_name].revid = res['edit'].get('newrevid', revision.revid)
+
+            return res
+
+    async def edit(self, page_name, text, reason, base=None):
+        # base is the revision the text was derived from; the edit then only touches its section and fails on a conflict
         data = {
             'action': 'edit',
             'title': page_name,
-            'token': csrf,
             'format': 'json',
             'text': text,
+            'section': base.section if base is not None else None,
+            'baserevid': base.revid if base is not None else None,
+            'basetimestamp': base.timestamp if base is not None else None,
+            'nocreate': base is not None,
             'bot': True,
             'minor': True,
             'summary': reason,
         }
 
-        res = self.session.post(self.api_endpoint, data=data)
-        logger.debug(res.text)
+        res = await self._write(data)
+        logger.debug(res)
 
-    def block(self, user, reason):
-        csrf = self._get_csrf()
+        return res
 
+    async def block(self, user, reason):
         data = {
             'action': 'block',
             'format': 'json',
@@ -73,10 +297,48 @@ class AttuWiki:
             'autoblock': True,
             'noemail': True,
             'reblock': True,
-            'token': csrf,
         }
 
-        res = self.session.post(self.api_endpoint, data=data)
-        logger.debug(res.text)
+        res = await self._write(data)
+        logger.debug(res)
+
+        return res
+
+    async def block_many(self, users, reason, workers=3, on_result=None):
+        # a small pool over this one session; (user, response or exception) in input order
+        if not self.logged_in:
+            await self._ensure_login()
+
+        # fetched once up front, otherwise every worker would race to fetch its own
+        await self._get_csrf()
+        semaphore = asyncio.Semaphore(workers)
+
+        async def block_one(user):
+            # a failed user is still a processed one, so progress keeps moving
+            try:
+                async with semaphore:
+                    res = await self.block(user, reason)
+            except Exception as error:
+                res = error
+
+            if on_result is not None:
+                on_result(user, res)
+
+            return res
+
+        results = await asyncio.gather(*(block_one(user) for user in users), return_exceptions=True)
+        return list(zip(users, results, strict=True))
+
+# --- Shared Clients ---
+
+clients = {}
+
+def get_wiki(api_endpoint, user, key, timeout=30):
+    # one long-lived client per endpoint/user so the login session and csrf token survive between commands
+    client = clients.get((api_endpoint, user))
+
+    if client is None:
+        client = clients[(api_endpoint, user)] = AttuWiki(api_endpoint, timeout=timeout)
 
-        return res.json()
+    client.set_credentials(user, key)
+    return client
@@ -0,0 +1,166 @@
+"""
+AttuBot - Precomputed year calendar
+Author(s): @jhnhnck <john@jhnhnck.com>
+
+This file is licensed under the Apache License, Version 2.0; See LICENSE for full text.
+"""
+
+import time
+from array import array
+from datetime import date, datetime
+from datetime import time as clock_time
+from types import SimpleNamespace
+
+discord_epoch = 1420070400000
+unix_day = date(1970, 1, 1).toordinal()
+
+def snowflake_seconds(snowflake):
+    # same result as int(snowflake_time(snowflake).timestamp()) without the datetime
+    return ((snowflake >> 22) + discord_epoch) // 1000
+
+def local_day(unix):
+    # (local day number, seconds into the local day) using the process timezone
+    return divmod(int(unix) + time.localtime(unix).tm_gmtoff, 86400)
+
+class YearIndex:
+    horizon_years = 256
+
+    def __init__(self, epoch, timestamps, trigger_time, *, paused=False, now=None):
+        # epoch is (epoch_time, epoch_year, epoch_length)
+        epoch_time, epoch_year, epoch_length = epoch
+        now = time.time() if now is None else now
+
+        self.epoch_year = epoch_year
+        self.epoch_length = epoch_length
+        self.paused = paused
+        self.trigger_time = trigger_time
+        self.trigger_seconds = trigger_time.hour * 3600 + trigger_time.minute * 60 + trigger_time.second
+        self.epoch_day, _ = local_day(epoch_time)
+
+        # past[n] is the start of year n + 1, decoded from the stored year marker snowflakes
+        self.markers = list(timestamps)
+        self.past = array('q', (snowflake_seconds(marker) for marker in self.markers))
+
+        # projected[n] is the boundary (trigger time on a multiple of epoch_length days) opening year first_year + n
+        today, _ = local_day(now)
+        self.first_year = min(epoch_year, epoch_year + (today - self.epoch_day) // epoch_length)
+        last_year = epoch_year + (today - self.epoch_day) // epoch_length + self.horizon_years
+
+        self.projected = array('q', (self._boundary(year) for year in range(self.first_year, last_year + 1)))
+
+    def _boundary(self, year):
+        day = self.epoch_day + (year - self.epoch_year) * self.epoch_length
+        return int(datetime.combine(date.fromordinal(unix_day + day), self.trigger_time).timestamp())
+
+    def year_start(self, year):
+        offset = year - self.first_year
+
+        if 0 <= offset < len(self.projected):
+            return self.projected[offset]
+
+        # only reached for years past the precomputed horizon
+        return self._boundary(year)
+
+    def status(self, now=None):
+        now = time.time() if now is None else now
+        day, seconds = local_day(now)
+        elapsed_days = day - self.epoch_day
+
+        # the day a year ends still belongs to it until trigger time
+        offset = (elapsed_days - (seconds < self.trigger_seconds)) // self.epoch_length
+
+        # before a future epoch (set when resuming, or when waiting out the current year) the year in progress carries on
+        year = self.epoch_year + max(offset, -1)
+
+        # no new years begin while time is paused, however long the pause runs past a boundary
+        if self.paused and self.past:
+            year = min(year, len(self.past))
+
+        return elapsed_days, year
+
+    def next_change(self, now=None):
+        # next instant where status() or pending_rollover() can give a different answer
+        now = time.time() if now is None else now
+        _, year = self.status(now)
+
+        start = self.year_start(year + 1)
+        day, _ = local_day(start)
+        midnight = int(datetime.combine(date.fromordinal(unix_day + day), clock_time()).timestamp())
+
+        return midnight if midnight > now else start
+
+    def pending_rollover(self, now=None):
+        # true between midnight and trigger time on the day a new year begins
+        now = time.time() if now is None else now
+        day, seconds = local_day(now)
+
+        return day >= self.epoch_day and (day - self.epoch_day) % self.epoch_length == 0 and seconds < self.trigger_seconds
+
+    def next_year(self, now=None):
+        if self.paused:
+            return 0
+
+        _, year = self.status(now)
+        return self.year_start(year + 1)
+
+    def marker(self, year):
+        return self.markers[year - 1]
+
+    @property
+    def marker_count(self):
+        return len(self.markers)
+
+    def span(self, year, now=None):
+        result = SimpleNamespace(start_time=0, end_time=0, duration=0)
+        _, current_year = self.status(now)
+
+        # Invalid Years
+        if year <= 0:
+            return result
+
+        # Past Years
+        if year < current_year:
+            result.start_time = self.past[year - 1]
+            result.end_time = self.past[year]
+
+        # Current Year
+        elif year == current_year:
+            result.start_time = self.past[year - 1]
+            result.end_time = self.next_year(now)
+
+        # Future Years
+        elif not self.paused:
+            result.start_time = self.year_start(year)
+            result.end_time = self.year_start(year + 1)
+
+        result.duration = round((result.end_time - result.start_time) / 86400)
+        return result
+
+    def spans(self, first, last, now=None):
+        # every year in [first, last] from a single status computation
+        _, current_year = self.status(now)
+        next_year = self.next_year(now)
+        results = []
+
+        for year in range(max(first, 1), last + 1):
+            result = SimpleNamespace(year=year, start_time=0, end_time=0, duration=0)
+
+            # Past Years (differences between consecutive markers)
+            if year < current_year:
+                result.start_time = self.past[year - 1] if year <= len(self.past) else 0
+                result.end_time = self.past[year] if year < len(self.past) else 0
+
+            # Current Year
+            elif year == current_year:
+                result.start_time = self.past[year - 1] if year <= len(self.past) else 0
+                result.end_time = next_year
+
+            # Future Years (arithmetic progression of boundaries)
+            elif not self.paused:
+                result.start_time = self.year_start(year)
+                result.end_time = self.year_start(year + 1)
+
+            result.duration = round((result.end_time - result.start_time) / 86400)
+            results.append(result)
+
+        return results
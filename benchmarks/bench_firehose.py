@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+
+"""
+AttuBot - Gateway event firehose benchmark
+Author(s): @jhnhnck <john@jhnhnck.com>
+
+This file is licensed under the Apache License, Version 2.0; See LICENSE for full text.
+"""
+
+import argparse
+import asyncio
+import atexit
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+from statistics import mean, quantiles
+
+root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(root))
+
+# core reads its config location, timezone and log level at import, so point them at scratch values first
+workdir = Path(tempfile.mkdtemp(prefix='attubot-firehose-'))
+os.environ.setdefault('TZ', 'America/New_York')
+os.environ.setdefault('LOG_LEVEL', 'fatal')
+os.environ['BOT_CONFIG_FILE'] = str(workdir / 'attu-bot.json')
+os.environ['BOT_STATE_FILE'] = str(workdir / 'attu-bot.db')
+time.tzset()
+
+from attubot import __version__, core  # noqa: E402
+from attubot.clock import VirtualClock  # noqa: E402
+from benchmarks.fakes import (  # noqa: E402
+    FakeGateway,
+    guild_payload,
+    interaction_payload,
+    member_payload,
+    message_payload,
+    snowflake,
+    user_payload,
+)
+
+@atexit.register
+def remove_workdir():
+    # the scratch config, the sqlite state store and its wal files go with the directory
+    if core.config.store is not None:
+        core.config.store.close()
+
+    shutil.rmtree(workdir, ignore_errors=True)
+
+ids = {
+    'attu': 100, 'jhn': 200, 'owner': 300, 'leaders': 400, 'member': 500, 'doombot': 600,
+    'activity': 101, 'announcements': 102, 'year_vc': 103, 'doom_forum': 104, 'year_links': 105, 'meta_chat': 106, 'error_log': 201,
+    'lore_channels': [111, 112, 113, 114, 115],
+}
+
+# relative weights of each generated event
+message_mix = { 'doombot_post': 2, 'activity_chatter': 2, 'lore_chatter': 6 }
+interaction_mix = { 'check_year': 4, 'link_year': 3, 'year_table': 2, 'debug_denied': 1, 'force_error': 0.5 }
+
+# --- Scenario ---
+
+def write_config(epoch_time, years):
+    raw = json.loads((root / 'config' / 'attu-bot.sample.json').read_text())
+
+    raw['channels'] = { name: ids[name] for name in ('activity', 'announcements', 'year_vc', 'doom_forum', 'year_links', 'meta_chat', 'lore_channels', 'error_log') }
+    raw['roles'] = { 'leaders': ids['leaders'] }
+    raw['users'] = { 'bot_owner': ids['owner'] }
+    raw['guilds'] = { 'attu': ids['attu'], 'jhn': ids['jhn'] }
+    raw['epoch'] = { 'time': int(epoch_time), 'year': years, 'paused': False, 'length': 14 }
+    raw['timestamps'] = [snowflake(epoch_time - (years - year) * 14 * 86400) for year in range(1, years + 1)]
+
+    (workdir / 'attu-bot.json').write_text(json.dumps(raw, indent=4))
+
+def setup(gateway):
+    timeline = core.config.default_timeline
+
+    channels = [(ids['activity'], 'activity'), (timeline.meta_chat_channel, 'meta-chat'), (timeline.announce_channel, 'announcements')]
+    channels.extend((channel_id, f'lore-{position}') for position, channel_id in enumerate(timeline.lore_channels))
+
+    gateway.add_guild(guild_payload(ids['attu'], channels, [(timeline.announce_role, 'leaders')], name='attu'))
+    gateway.add_guild(guild_payload(ids['jhn'], [(ids['error_log'], 'error-log')], [], name='jhn'))
+
+def bind_commands():
+    # commands answer under made-up ids, as if sync_commands() had already run
+    core.bind_command_ids({ command.name: str(900 + position) for position, command in enumerate(sorted(core.bot.pending_application_commands, key=lambda command: command.name)) })
+
+def get_command(name):
+    return next(command for command in core.bot.pending_application_commands if command.name == name)
+
+def generate(count, interaction_share, seed, years):
+    # seeded so a run can be replayed; nothing here needs cryptographic randomness
+    rng = random.Random(seed)  # noqa: S311
+    timeline = core.config.default_timeline
+    member = member_payload(ids['member'], 'member')
+    owner = member_payload(ids['owner'], 'owner')
+    events = []
+
+    for sequence in range(count):
+        event_id = snowflake(core.clock.time(), sequence)
+
+        if rng.random() >= interaction_share:
+            name = rng.choices(list(message_mix), weights=message_mix.values())[0]
+
+            if name == 'doombot_post':
+                payload = message_payload(event_id, ids['activity'], ids['attu'], f'[DoomBot] Doom level {rng.randint(1, 10)}', user_payload(ids['doombot'], 'DoomBot', bot=True))
+            elif name == 'activity_chatter':
+                payload = message_payload(event_id, ids['activity'], ids['attu'], 'anyone around?', member['user'])
+            else:
+                payload = message_payload(event_id, rng.choice(timeline.lore_channels), ids['attu'], 'The fleet crested the ridge at dawn.' * rng.randint(1, 20), member['user'])
+
+            events.append({ 'kind': 'message', 'name': name, 'payload': payload })
+            continue
+
+        name = rng.choices(list(interaction_mix), weights=interaction_mix.values())[0]
+        channel = rng.choice(timeline.lore_channels)
+
+        if name == 'check_year':
+            payload = interaction_payload(event_id, ids['attu'], channel, member, get_command('check_year'), year=(4, rng.randint(1, years + 5)))
+        elif name == 'link_year':
+            payload = interaction_payload(event_id, ids['attu'], channel, member, get_command('link_year'), year=(4, rng.randint(1, years)), channel=(3, str(rng.choice(timeline.lore_channels))))
+        elif name == 'year_table':
+            payload = interaction_payload(event_id, ids['attu'], channel, member, get_command('year_table'))
+        elif name == 'debug_denied':
+            payload = interaction_payload(event_id, ids['attu'], channel, member, get_command('debug'), option=(3, 'version'))
+        else:
+            payload = interaction_payload(event_id, ids['attu'], channel, owner, get_command('debug'), option=(3, 'force_error'))
+
+        events.append({ 'kind': 'interaction', 'name': name, 'payload': payload })
+
+    return events
+
+# --- Event Tracking ---
+
+# the handler tasks spawned while an event is processed, including ones its handlers dispatch in turn (e.g. errors)
+current_event = ContextVar('current_event', default=None)
+
+def track_handlers(bot):
+    schedule = bot._schedule_event
+
+    def tracked(*args, **kwargs):
+        task = schedule(*args, **kwargs)
+        tasks = current_event.get()
+
+        if tasks is not None:
+            tasks.append(task)
+
+        return task
+
+    bot._schedule_event = tracked
+
+async def settle(tasks):
+    while tasks:
+        await tasks.pop()
+
+def feed(gateway, event):
+    tasks = []
+    token = current_event.set(tasks)
+
+    try:
+        gateway.feed(event['kind'], event['payload'])
+    finally:
+        current_event.reset(token)
+
+    return tasks
+
+async def process(gateway, event):
+    await settle(feed(gateway, event))
+
+# --- Measurement ---
+
+async def run_closed(gateway, events):
+    # one event at a time: pure handler cost
+    latencies = []
+    started = time.perf_counter()
+
+    for event in events:
+        event_started = time.perf_counter()
+        await process(gateway, event)
+        latencies.append(time.perf_counter() - event_started)
+
+    return latencies, time.perf_counter() - started
+
+async def run_open(gateway, events, rate):
+    # events arrive on schedule whether or not earlier ones finished, so handlers queue behind each other as they would live
+    latencies = [0.0] * len(events)
+    pending = []
+    started = time.perf_counter()
+
+    async def finish(position, fed, tasks):
+        await settle(tasks)
+        latencies[position] = time.perf_counter() - fed
+
+    for position, event in enumerate(events):
+        delay = started + position / rate - time.perf_counter()
+
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        pending.append(asyncio.create_task(finish(position, time.perf_counter(), feed(gateway, event))))
+
+    await asyncio.gather(*pending)
+    return latencies, time.perf_counter() - started
+
+async def measure_allocations(gateway, events):
+    # transient peak and retained bytes per event; tracing slows everything down, so this is its own pass
+    tracemalloc.start()
+    peaks = []
+    baseline, _ = tracemalloc.get_traced_memory()
+
+    for event in events:
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+
+        await process(gateway, event)
+
+        peaks.append(tracemalloc.get_traced_memory()[1] - before)
+
+    retained = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+
+    return peaks, retained
+
+def percentiles(latencies):
+    if len(latencies) < 2:
+        value = latencies[0] * 1000 if latencies else 0
+        return { 'p50': round(value, 4), 'p99': round(value, 4) }
+
+    cuts = quantiles(latencies, n=100, method='inclusive')
+    return { 'p50': round(cuts[49] * 1000, 4), 'p99': round(cuts[98] * 1000, 4) }
+
+def summarize(events, latencies, elapsed, peaks, retained):
+    kinds = {}
+
+    for position, event in enumerate(events):
+        kinds.setdefault(event['name'], []).append(position)
+
+    return {
+        'events': len(events),
+        'events_per_second': round(len(events) / elapsed, 1),
+        'latency_ms': percentiles(latencies),
+        'alloc_peak_bytes_per_event': round(mean(peaks)) if peaks else 0,
+        'retained_bytes_per_event': round(retained / len(peaks)) if peaks else 0,
+        'by_event': {
+            name: {
+                'events': len(positions),
+                'latency_ms': percentiles([latencies[position] for position in positions]),
+                'alloc_peak_bytes': round(mean(peaks[position] for position in positions if position < len(peaks))) if any(position < len(peaks) for position in positions) else 0,
+            }
+            for name, positions in sorted(kinds.items())
+        },
+    }
+
+async def firehose(events, rate, warmup, trace_events, latency):
+    gateway = FakeGateway(core.bot, core.clock.time, latency=latency)
+    gateway.install()
+
+    # same REST instrumentation and routes as a live bot
+    core.instrument_discord_http()
+    core.register_routes()
+    setup(gateway)
+    track_handlers(core.bot)
+
+    # fills the render and autocomplete caches the way a running bot has them
+    for event in events[:warmup]:
+        await process(gateway, event)
+
+    measured = events[warmup:]
+    latencies, elapsed = await (run_open(gateway, measured, rate) if rate else run_closed(gateway, measured))
+    peaks, retained = await measure_allocations(gateway, measured[:trace_events])
+
+    result = summarize(measured, latencies, elapsed, peaks, retained)
+    result['rate'] = rate
+    result['requests'] = dict(gateway.requests)
+    result['errors_recorded'] = sum(entry.count for entry in core.error_collector.pending.values())
+
+    return result
+
+# --- Reporting ---
+
+def report(result):
+    print(f'{result["events"]} events at {result["events_per_second"]} events/s')
+    print(f'Latency: p50 {result["latency_ms"]["p50"]} ms, p99 {result["latency_ms"]["p99"]} ms')
+    print(f'Allocations: peak {result["alloc_peak_bytes_per_event"]} B per event, {result["retained_bytes_per_event"]} B retained per event')
+
+    for name, row in result['by_event'].items():
+        print(f'  {name:<18} {row["events"]:>7} events  p50 {row["latency_ms"]["p50"]:>8.4f} ms  p99 {row["latency_ms"]["p99"]:>8.4f} ms  peak {row["alloc_peak_bytes"]:>8} B')
+
+    print(f'Requests: {result["requests"]}')
+    print(f'Errors recorded: {result["errors_recorded"]}')
+
+def compare(result, baseline_file, threshold):
+    baseline = json.loads(Path(baseline_file).read_text())['result']
+    regressions = []
+
+    # an offered rate caps throughput, so it only means something for back to back runs
+    if not result['rate'] and not baseline.get('rate') and baseline['events_per_second'] / result['events_per_second'] > threshold:
+        regressions.append(f'throughput: {baseline["events_per_second"]} -> {result["events_per_second"]} events/s')
+
+    for name in ('p50', 'p99'):
+        before, after = baseline['latency_ms'][name], result['latency_ms'][name]
+
+        if before and after / before > threshold:
+            regressions.append(f'{name} latency: {before} ms -> {after} ms')
+
+    for name in ('alloc_peak_bytes_per_event', 'retained_bytes_per_event'):
+        before, after = baseline[name], result[name]
+
+        if before > 0 and after / before > threshold:
+            regressions.append(f'{name}: {before} -> {after}')
+
+    for line in regressions:
+        print(f'REGRESSION {line}')
+
+    return not regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay gateway messages and interactions through attubot's handlers without a network connection")
+    parser.add_argument('--events', type=int, default=20000, help='events to generate (ignored with --replay)')
+    parser.add_argument('--interactions', type=float, default=0.2, help='share of generated events that are slash commands')
+    parser.add_argument('--rate', type=float, default=0, help='events per second to offer (0 runs them back to back)')
+    parser.add_argument('--warmup', type=int, default=500, help='events processed before measuring')
+    parser.add_argument('--trace-events', type=int, default=2000, help='events replayed again with tracemalloc to measure allocations')
+    parser.add_argument('--latency', type=float, default=0.0, help='artificial seconds added to every fake REST and interaction response')
+    parser.add_argument('--years', type=int, default=40, help='years of history in the timeline')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--replay', help='json-lines file of recorded events ({"kind", "name", "payload"}) to feed instead of generating')
+    parser.add_argument('--record', help='write the generated events as json lines for later replays')
+    parser.add_argument('--output', default='firehose_output.json', help='where to write the json results')
+    parser.add_argument('--baseline', help='previous results file to compare against')
+    parser.add_argument('--threshold', type=float, default=1.25, help='slowdown ratio counted as a regression')
+    args = parser.parse_args()
+
+    epoch_time = datetime(2030, 3, 1, 17, 0).timestamp()
+    core.clock = VirtualClock(epoch_time + 3 * 86400)
+
+    write_config(epoch_time, args.years)
+    core.config.load_from_file()
+    bind_commands()
+
+    if args.replay:
+        events = [json.loads(line) for line in Path(args.replay).read_text().splitlines() if line.strip()]
+    else:
+        events = generate(args.events + args.warmup, args.interactions, args.seed, args.years)
+
+    if args.record:
+        Path(args.record).write_text(''.join(json.dumps(event) + '\n' for event in events))
+        print(f'Recorded {len(events)} events to {args.record}')
+
+    result = asyncio.run(firehose(events, args.rate, args.warmup, args.trace_events, args.latency))
+    report(result)
+
+    Path(args.output).write_text(json.dumps({
+        'meta': {
+            'version': __version__,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'memory_mode': core.memory_mode,
+            'created': int(time.time()),
+            'args': vars(args),
+        },
+        'result': result,
+    }, indent=4))
+
+    print(f'Wrote results to {args.output}')
+
+    if args.baseline and not compare(result, args.baseline, args.threshold):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+
+"""
+AttuBot - Timekeeping benchmarks
+Author(s): @jhnhnck <john@jhnhnck.com>
+
+This file is licensed under the Apache License, Version 2.0; See LICENSE for full text.
+"""
+
+import argparse
+import atexit
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import timeit
+from datetime import datetime, timedelta
+from pathlib import Path
+
+root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(root))
+
+# core reads its config location, timezone and log level at import, so point them at scratch values first
+workdir = Path(tempfile.mkdtemp(prefix='attubot-bench-'))
+os.environ.setdefault('TZ', 'America/New_York')
+os.environ.setdefault('LOG_LEVEL', 'warn')
+os.environ['BOT_CONFIG_FILE'] = str(workdir / 'attu-bot.json')
+os.environ['BOT_STATE_FILE'] = str(workdir / 'attu-bot.db')
+time.tzset()
+
+(workdir / 'attu-bot.json').write_text((root / 'config' / 'attu-bot.sample.json').read_text())
+
+from attubot import __version__, core  # noqa: E402
+from attubot.clock import VirtualClock  # noqa: E402
+from attubot.years import discord_epoch  # noqa: E402
+
+@atexit.register
+def remove_workdir():
+    # the scratch config, the sqlite state store and its wal files go with the directory
+    if core.config.store is not None:
+        core.config.store.close()
+
+    shutil.rmtree(workdir, ignore_errors=True)
+
+lengths = [1, 14, 365]
+year_counts = [10, 1000, 5000]
+
+# --- Scenarios ---
+
+def snowflake(unix):
+    return (int(unix * 1000) - discord_epoch) << 22
+
+def get_timeline():
+    if core.config.store is None:
+        core.config.load_from_file()
+
+    return core.config.default_timeline
+
+def at_trigger(day):
+    return datetime.combine(day, get_timeline().trigger_time).timestamp()
+
+def load_scenario(length, years, paused):
+    # the current year (`years`) began at 2030-03-01 trigger time, with one marker per year before it
+    start_day = datetime(2030, 3, 1).date()
+    markers = [snowflake(at_trigger(start_day - timedelta(days=length * (years - year)))) for year in range(1, years + 1)]
+
+    timeline = get_timeline()
+    timeline.store.db.execute('DELETE FROM timestamps WHERE timeline = ?', (timeline.name,))
+    timeline.store.migrate({ 'time': at_trigger(start_day), 'year': years, 'length': length, 'paused': paused }, markers)
+    timeline.load_state()
+
+    next_day = start_day + timedelta(days=length)
+
+    return {
+        'mid_year': at_trigger(start_day) + length * 43200,
+        'before_trigger': at_trigger(next_day) - 1,
+        'at_trigger': at_trigger(next_day),
+        'after_trigger': at_trigger(next_day) + 1,
+    }
+
+def restore_epoch(timeline, snapshot):
+    timeline.set_epoch(snapshot[0], snapshot[1], length=snapshot[2], paused=snapshot[3])
+
+def cases(years):
+    timeline = get_timeline()
+
+    def move_epoch():
+        snapshot = (timeline.epoch_time, timeline.epoch_year, timeline.epoch_length, timeline.time_paused)
+        core.move_epoch(timeline, timeline.epoch_length)
+        restore_epoch(timeline, snapshot)
+
+    def rebuild_index():
+        timeline.year_cache.revision = None
+        core.get_year_index(timeline)
+
+    benches = {
+        'get_year_status': lambda: core.get_year_status(timeline),
+        'get_next_year': lambda: core.get_next_year(timeline),
+        'get_year_span_past': lambda: core.get_year_span(timeline, years // 2 or 1),
+        'get_year_span_future': lambda: core.get_year_span(timeline, years + 10),
+        'format_year_line': lambda: core.format_year_line(years),
+        'move_epoch+restore': move_epoch,
+        'rebuild_index': rebuild_index,
+    }
+
+    # at or past trigger time the new year has no marker yet, so the current span (and move_epoch) is undefined
+    if core.get_year_status(timeline)[1] > len(timeline.timestamps):
+        del benches['move_epoch+restore']
+
+    return benches
+
+# --- Measurement ---
+
+def measure(fn, repeat):
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+
+    return number, min(timer.repeat(repeat=repeat, number=number)) / number * 1e9
+
+def run(repeat, quick):
+    results = []
+
+    for length in lengths:
+        for years in year_counts[:1] if quick else year_counts:
+            for paused in (False, True):
+                edges = load_scenario(length, years, paused)
+                scenario = f'length{length}_years{years}_{"paused" if paused else "running"}'
+
+                for edge, unix in edges.items():
+                    core.clock = VirtualClock(unix)
+
+                    for case, fn in cases(years).items():
+                        calls, ns = measure(fn, repeat)
+                        results.append({ 'scenario': scenario, 'edge': edge, 'case': case, 'ns_per_call': round(ns, 1), 'calls': calls })
+
+                        print(f'{scenario:<32} {edge:<15} {case:<22} {ns:>12.1f} ns')
+
+    return results
+
+def compare(results, baseline_file, threshold):
+    baseline = { (row['scenario'], row['edge'], row['case']): row['ns_per_call'] for row in json.loads(Path(baseline_file).read_text())['results'] }
+    regressions = []
+
+    for row in results:
+        before = baseline.get((row['scenario'], row['edge'], row['case']))
+
+        if before and row['ns_per_call'] / before > threshold:
+            regressions.append(f'{row["scenario"]} {row["edge"]} {row["case"]}: {before:.1f} ns -> {row["ns_per_call"]:.1f} ns')
+
+    for line in regressions:
+        print(f'REGRESSION {line}')
+
+    return not regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the attubot timekeeping engine')
+    parser.add_argument('--output', default='bench_output.json', help='where to write the json results')
+    parser.add_argument('--baseline', help='previous results file to compare against')
+    parser.add_argument('--threshold', type=float, default=1.25, help='slowdown ratio counted as a regression')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--quick', action='store_true', help='only the smallest timestamp count')
+    args = parser.parse_args()
+
+    results = run(args.repeat, args.quick)
+
+    Path(args.output).write_text(json.dumps({
+        'meta': {
+            'version': __version__,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'timezone': os.environ['TZ'],
+            'created': int(time.time()),
+        },
+        'results': results,
+    }, indent=4))
+
+    print(f'Wrote {len(results)} results to {args.output}')
+
+    if args.baseline and not compare(results, args.baseline, args.threshold):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,399 @@
+"""
+AttuBot - Local Discord, gateway and MediaWiki stand-ins for benchmarks and simulations
+Author(s): @jhnhnck <john@jhnhnck.com>
+
+This file is licensed under the Apache License, Version 2.0; See LICENSE for full text.
+"""
+
+import asyncio
+import itertools
+import re
+from collections import Counter
+from datetime import UTC, datetime
+from types import SimpleNamespace
+
+import discord
+from aiohttp import web
+from discord.webhook.async_ import AsyncWebhookAdapter, async_context
+
+from attubot.wiki import heading
+from attubot.years import discord_epoch
+
+def snowflake(unix, sequence=0):
+    return ((int(unix * 1000) - discord_epoch) << 22) | (sequence & 0x3FFFFF)
+
+# --- Discord ---
+
+class FakeDiscord:
+    # just enough of a guild for the bot: every call is counted and can be given an artificial latency
+    def __init__(self, get_time, latency=0.0):
+        self.get_time = get_time
+        self.latency = latency
+        self.requests = Counter()
+        self.guilds = {}
+        self.sequence = itertools.count()
+
+    def next_id(self):
+        return snowflake(self.get_time(), next(self.sequence))
+
+    async def request(self, route):
+        self.requests[route] += 1
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def add_guild(self, guild_id):
+        self.guilds[guild_id] = FakeGuild(self, guild_id)
+        return self.guilds[guild_id]
+
+    def get_guild(self, guild_id):
+        return self.guilds.get(guild_id)
+
+    def install(self, bot):
+        bot.get_guild = self.get_guild
+
+class FakeGuild:
+    def __init__(self, discord, guild_id):
+        self.discord = discord
+        self.id = guild_id
+        self.channels = {}
+        self.roles = {}
+
+    def add_channel(self, channel_id, name='channel'):
+        self.channels[channel_id] = FakeChannel(self.discord, self, channel_id, name)
+        return self.channels[channel_id]
+
+    def add_role(self, role_id, name='role'):
+        self.roles[role_id] = SimpleNamespace(id=role_id, name=name, guild=self)
+        return self.roles[role_id]
+
+    def get_channel(self, channel_id):
+        return self.channels.get(channel_id)
+
+    def get_role(self, role_id):
+        return self.roles.get(role_id)
+
+class FakeChannel:
+    def __init__(self, discord, guild, channel_id, name):
+        self.discord = discord
+        self.guild = guild
+        self.id = channel_id
+        self.name = name
+        self.messages = []
+        self.threads = {}
+        self.archived = False
+
+    @property
+    def mention(self):
+        return f'<#{self.id}>'
+
+    def add_thread(self, thread_id, name='thread'):
+        self.threads[thread_id] = FakeThread(self.discord, self.guild, thread_id, name)
+        return self.threads[thread_id]
+
+    def get_thread(self, thread_id):
+        return self.threads.get(thread_id)
+
+    async def send(self, content):
+        await self.discord.request('send_message')
+
+        message = FakeMessage(self.discord.next_id(), content, self)
+        self.messages.append(message)
+
+        return message
+
+    async def edit(self, **fields):
+        await self.discord.request('edit_channel')
+
+        for name, value in fields.items():
+            setattr(self, name, value)
+
+    async def history(self, limit=100, before=None, after=None, oldest_first=False):
+        messages = [message for message in self.messages if (before is None or message.id < getattr(before, 'id', before)) and (after is None or message.id > getattr(after, 'id', after))]
+        messages = messages if oldest_first else messages[::-1]
+
+        # discord pages history 100 messages per request
+        for position, message in enumerate(messages[:limit]):
+            if position % 100 == 0:
+                await self.discord.request('history')
+
+            yield message
+
+class FakeThread(FakeChannel, discord.Thread):
+    # the bot tells threads apart by type; every behaviour still comes from FakeChannel
+    pass
+
+class FakeMessage:
+    def __init__(self, message_id, content, channel, author=None):
+        self.id = message_id
+        self.content = content
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author or SimpleNamespace(id=0, name='attubot', bot=True)
+        self.reactions = []
+
+    async def add_reaction(self, emoji):
+        await self.channel.discord.request('add_reaction')
+        self.reactions.append(emoji)
+
+# --- Gateway ---
+
+gateway_timestamp = '2030-01-01T00:00:00+00:00'
+
+def user_payload(user_id, name='user', bot=False):
+    return { 'id': str(user_id), 'username': name, 'global_name': name, 'discriminator': '0', 'avatar': None, 'bot': bot }
+
+def member_payload(user_id, name='user', roles=()):
+    return { 'user': user_payload(user_id, name), 'roles': [str(role_id) for role_id in roles], 'joined_at': gateway_timestamp, 'deaf': False, 'mute': False, 'permissions': '0' }
+
+def channel_payload(channel_id, name='channel'):
+    return { 'id': str(channel_id), 'name': name, 'type': 0, 'position': 0, 'permission_overwrites': [] }
+
+def role_payload(role_id, name='role'):
+    colors = { 'primary_color': 0, 'secondary_color': None, 'tertiary_color': None }
+    return { 'id': str(role_id), 'name': name, 'permissions': '0', 'position': 0, 'color': 0, 'colors': colors, 'hoist': False, 'managed': False, 'mentionable': False }
+
+def guild_payload(guild_id, channels, roles, name='guild'):
+    # channels and roles are (id, name) pairs; the guild id doubles as @everyone
+    return {
+        'id': str(guild_id),
+        'name': name,
+        'channels': [channel_payload(channel_id, channel_name) for channel_id, channel_name in channels],
+        'roles': [role_payload(guild_id, '@everyone'), *(role_payload(role_id, role_name) for role_id, role_name in roles)],
+        'members': [],
+        'threads': [],
+        'member_count': 1,
+        'unavailable': False,
+    }
+
+def message_payload(message_id, channel_id, guild_id, content, author):
+    return {
+        'id': str(message_id),
+        'channel_id': str(channel_id),
+        'guild_id': str(guild_id) if guild_id is not None else None,
+        'content': content,
+        'author': author,
+        'attachments': [],
+        'embeds': [],
+        'mentions': [],
+        'mention_roles': [],
+        'mention_everyone': False,
+        'pinned': False,
+        'tts': False,
+        'timestamp': gateway_timestamp,
+        'edited_timestamp': None,
+        'type': 0,
+    }
+
+def interaction_payload(interaction_id, guild_id, channel_id, member, command, **options):
+    # an invocation of one of the bot's slash commands; each option is given as (discord option type, value)
+    options = [{ 'name': option, 'type': kind, 'value': value } for option, (kind, value) in options.items()]
+
+    return {
+        'id': str(interaction_id),
+        'application_id': '1',
+        'type': 2,
+        'token': f'token-{interaction_id}',
+        'version': 1,
+        'guild_id': str(guild_id),
+        'channel_id': str(channel_id),
+        'member': member,
+        'data': { 'id': str(command.id), 'name': command.name, 'type': 1, 'options': options },
+        'locale': 'en-US',
+        'guild_locale': 'en-US',
+    }
+
+class FakeGateway:
+    # raw gateway payloads go through py-cord's own parsers and event dispatch; REST calls and interaction callbacks are answered locally
+    def __init__(self, bot, get_time, latency=0.0):
+        self.bot = bot
+        self.state = bot._connection
+        self.get_time = get_time
+        self.latency = latency
+        self.requests = Counter()
+        self.sequence = itertools.count()
+
+    def next_id(self):
+        return snowflake(self.get_time(), next(self.sequence))
+
+    def install(self):
+        gateway = self
+
+        class Adapter(AsyncWebhookAdapter):
+            async def request(self, route, session, **kwargs):
+                return await gateway.webhook(route, **kwargs)
+
+        self.bot.http.request = self.rest
+        async_context.set(Adapter())
+
+    async def rest(self, route, **kwargs):
+        self.requests[f'{route.method} {route.path}'] += 1
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if route.method == 'POST' and route.path.endswith('/messages'):
+            return message_payload(self.next_id(), route.channel_id, route.guild_id, kwargs.get('json', {}).get('content'), user_payload(0, 'attubot', bot=True))
+
+        return None
+
+    async def webhook(self, route, payload=None, multipart=None, **kwargs):
+        self.requests[f'{route.method} {route.path}'] += 1
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        # followups come back as messages; the initial callback with the interaction it answered
+        if route.method == 'POST' and route.path.startswith('/webhooks/'):
+            return message_payload(self.next_id(), 0, None, (payload or {}).get('content'), user_payload(0, 'attubot', bot=True))
+
+        if route.path.endswith('/callback'):
+            return { 'interaction': { 'id': str(route.webhook_id), 'type': 2, 'response_message_loading': False, 'response_message_ephemeral': False } }
+
+        return {}
+
+    def add_guild(self, payload):
+        self.state.parse_guild_create(payload)
+
+    def feed(self, kind, payload):
+        # 'message' or 'interaction', exactly as they would arrive from the gateway
+        if kind == 'message':
+            self.state.parse_message_create(payload)
+        elif kind == 'interaction':
+            self.state.parse_interaction_create(payload)
+        else:
+            raise ValueError(f'unknown gateway event {kind!r}')
+
+# --- MediaWiki ---
+
+def split_sections(text):
+    # mediawiki section numbering: 0 is the lead, then one per heading in order
+    starts = [0, *(match.start() for match in heading.finditer(text)), len(text)]
+    return [text[start:end] for start, end in itertools.pairwise(starts)]
+
+class FakeWiki:
+    # serves the handful of api.php actions AttuWiki uses, backed by an in-memory page store
+    def __init__(self, pages=None, latency=0.0):
+        self.pages = { title: SimpleNamespace(text=text, revid=1) for title, text in (pages or {}).items() }
+        self.latency = latency
+        self.requests = Counter()
+        self.blocks = {}
+
+        # the next `throttled` writes are refused with a maxlag error, as a lagging wiki would
+        self.throttled = 0
+
+        self.runner = None
+        self.url = None
+
+    async def start(self, host='127.0.0.1'):
+        app = web.Application()
+        app.router.add_route('*', '/api.php', self.handle)
+
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+
+        site = web.TCPSite(self.runner, host, 0)
+        await site.start()
+
+        port = self.runner.addresses[0][1]
+        self.url = f'http://{host}:{port}/api.php'
+
+        return self.url
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+    async def handle(self, request):
+        params = dict(request.query)
+
+        if request.method == 'POST':
+            params.update(await request.post())
+
+        action = params.get('action', '')
+        self.requests[action] += 1
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        logged_in = request.cookies.get('session') == 'ok'
+        response = web.json_response(self.dispatch(action, params, logged_in))
+
+        if action == 'login' and params.get('lgpassword'):
+            response.set_cookie('session', 'ok')
+
+        return response
+
+    def dispatch(self, action, params, logged_in):
+        if action == 'query' and params.get('meta') == 'tokens':
+            name = 'logintoken' if params.get('type') == 'login' else 'csrftoken'
+            return { 'query': { 'tokens': { name: f'{name}+\\' } } }
+
+        if action == 'login':
+            return { 'login': { 'result': 'Success' if params.get('lgpassword') else 'Failed' } }
+
+        if params.get('assert') == 'user' and not logged_in:
+            return { 'error': { 'code': 'assertuserfailed', 'info': 'not logged in' } }
+
+        if action in ('edit', 'block') and self.throttled > 0:
+            self.throttled -= 1
+            return { 'error': { 'code': 'maxlag', 'info': 'Waiting for a database server: 1 seconds lagged', 'lag': 0 } }
+
+        return self.perform(action, params)
+
+    def perform(self, action, params):
+        # the actions left once the session and throttling checks have passed
+        if action == 'query' and params.get('prop') == 'revisions':
+            return self.query_revision(params)
+
+        if action == 'edit':
+            return self.edit(params)
+
+        if action == 'block':
+            self.blocks[params['user']] = params.get('reason', '')
+            return { 'block': { 'user': params['user'] } }
+
+        return { 'error': { 'code': 'badvalue', 'info': f'unsupported action {action!r}' } }
+
+    def query_revision(self, params):
+        page = self.pages.get(params['titles'])
+
+        if page is None:
+            return { 'query': { 'pages': [{ 'title': params['titles'], 'missing': True }] } }
+
+        text = page.text
+
+        if 'rvsection' in params:
+            sections = split_sections(text)
+            section = int(params['rvsection'])
+
+            if section >= len(sections):
+                return { 'error': { 'code': 'rvnosuchsection', 'info': f'There is no section {section}' } }
+
+            text = sections[section]
+
+        timestamp = datetime.fromtimestamp(page.revid, UTC).strftime('%Y-%m-%dT%H:%M:%SZ')
+        return { 'query': { 'pages': [{ 'title': params['titles'], 'revisions': [{ 'revid': page.revid, 'timestamp': timestamp, 'slots': { 'main': { 'content': text } } }] }] } }
+
+    def edit(self, params):
+        page = self.pages.get(params['title'])
+
+        if page is None:
+            return { 'error': { 'code': 'missingtitle', 'info': 'The page you specified does not exist' } }
+
+        if 'baserevid' in params and int(params['baserevid']) != page.revid:
+            return { 'error': { 'code': 'editconflict', 'info': 'Edit conflict' } }
+
+        if 'section' in params:
+            sections = split_sections(page.text)
+            sections[int(params['section'])] = params['text']
+            page.text = ''.join(sections)
+        else:
+            page.text = params['text']
+
+        page.revid += 1
+        return { 'edit': { 'result': 'Success', 'title': params['title'], 'newrevid': page.revid } }
+
+def find_text(wiki, title, pattern):
+    match = re.search(pattern, wiki.pages[title].text)
+    return match.group(0) if match else None
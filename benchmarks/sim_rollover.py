@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+
+"""
+AttuBot - Offline rollover simulator
+Author(s): @jhnhnck <john@jhnhnck.com>
+
+This file is licensed under the Apache License, Version 2.0; See LICENSE for full text.
+"""
+
+import argparse
+import asyncio
+import atexit
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from statistics import median
+
+root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(root))
+
+# core reads its config location, timezone and log level at import, so point them at scratch values first
+workdir = Path(tempfile.mkdtemp(prefix='attubot-sim-'))
+os.environ.setdefault('TZ', 'America/New_York')
+os.environ.setdefault('LOG_LEVEL', 'warn')
+os.environ['BOT_CONFIG_FILE'] = str(workdir / 'attu-bot.json')
+os.environ['BOT_STATE_FILE'] = str(workdir / 'attu-bot.db')
+time.tzset()
+
+from attubot import __version__, core  # noqa: E402
+from attubot.clock import VirtualClock  # noqa: E402
+from attubot.metrics import metrics  # noqa: E402
+from attubot.wiki import clients  # noqa: E402
+from benchmarks.fakes import FakeDiscord, FakeWiki, find_text, snowflake  # noqa: E402
+
+@atexit.register
+def remove_workdir():
+    # the scratch config, the sqlite state store and its wal files go with the directory
+    if core.config.store is not None:
+        core.config.store.close()
+
+    shutil.rmtree(workdir, ignore_errors=True)
+
+wiki_page = 'Attu Timeline'
+wiki_text = '\n'.join([
+    'The timeline of the Attu project.',
+    '== Present Day ==',
+    'Current Year: 1 PC',
+    '== History ==',
+    'Long ago, in Year 0 PC...',
+    '',
+])
+
+ids = {
+    'attu': 100, 'jhn': 200, 'owner': 300, 'leaders': 400,
+    'activity': 101, 'announcements': 102, 'year_vc': 103, 'doom_forum': 104, 'year_links': 105, 'meta_chat': 106, 'error_log': 201,
+    'lore_channels': [111, 112, 113, 114, 115],
+}
+
+lengths = [1, 7, 14, 30]
+
+# --- Scenario ---
+
+def extra_timeline(index, start):
+    # its own server (ids shifted by 1000 per timeline), wiki page, year length and trigger time
+    shift = index * 1000
+    trigger = datetime.fromtimestamp(start).replace(hour=12 + index % 10, minute=index * 7 % 60)
+    epoch_time = trigger.timestamp() - 86400
+
+    return {
+        'name': f'campaign-{index}',
+        'guild': ids['attu'] + shift,
+        'channels': { name: ids[name] + shift for name in ('announcements', 'year_vc', 'doom_forum', 'year_links', 'meta_chat') } | { 'lore_channels': [channel_id + shift for channel_id in ids['lore_channels']] },
+        'roles': { 'leaders': ids['leaders'] + shift },
+        'wiki': { 'page': f'{wiki_page} {index}' },
+        'trigger_time': f'{trigger:%H:%M}',
+        'epoch': { 'time': int(epoch_time), 'year': 1, 'paused': False, 'length': lengths[index % len(lengths)] },
+        'timestamps': [snowflake(epoch_time)],
+    }
+
+def write_config(wiki_url, epoch_time, reminder_hours, timelines):
+    raw = json.loads((root / 'config' / 'attu-bot.sample.json').read_text())
+
+    raw['wiki'].update({ 'api': wiki_url, 'page': wiki_page, 'user': 'SimBot', 'key': 'sim' })
+    raw['channels'] = { name: ids[name] for name in ('activity', 'announcements', 'year_vc', 'doom_forum', 'year_links', 'meta_chat', 'lore_channels', 'error_log') }
+    raw['roles'] = { 'leaders': ids['leaders'] }
+    raw['users'] = { 'bot_owner': ids['owner'] }
+    raw['guilds'] = { 'attu': ids['attu'], 'jhn': ids['jhn'] }
+    raw['epoch'] = { 'time': int(epoch_time), 'year': 1, 'paused': False, 'length': 14 }
+    raw['reminders'] = { 'hours': reminder_hours }
+    raw['timestamps'] = [snowflake(epoch_time)]
+    raw['timelines'] = [extra_timeline(index, epoch_time) for index in range(1, timelines)]
+
+    (workdir / 'attu-bot.json').write_text(json.dumps(raw, indent=4))
+
+def build_guilds(discord):
+    for timeline in core.config.timelines.values():
+        guild = discord.add_guild(timeline.guild_id)
+
+        for name in ('announce_channel', 'year_vc', 'meta_chat_channel'):
+            guild.add_channel(getattr(timeline, name), name)
+
+        for channel_id in timeline.lore_channels:
+            guild.add_channel(channel_id, f'lore-{channel_id}')
+
+        guild.add_channel(timeline.doom_forum, 'doom_forum').add_thread(timeline.year_link_thread, 'year-links')
+        guild.add_role(timeline.announce_role, 'leaders')
+
+    discord.get_guild(ids['attu']).add_channel(ids['activity'], 'activity')
+    discord.add_guild(ids['jhn']).add_channel(ids['error_log'], 'error-log')
+
+# --- Perturbations ---
+
+def perturb(timeline, rng, log):
+    # exercise the epoch moves an admin would make: dilation, or a pause that is resumed some days later
+    if rng.random() < 0.5:
+        length = rng.choice(lengths)
+        core.move_epoch(timeline, length)
+        log.append(('dilate', length))
+        return 0
+
+    timeline.time_paused = True
+    log.append(('pause', None))
+
+    return rng.randint(1, 30) * 86400
+
+def resume(timeline, log):
+    core.move_epoch(timeline, timeline.epoch_length, resume=True)
+    log.append(('resume', timeline.epoch_length))
+
+# --- Checks ---
+
+def check_year(discord, wiki, timeline, problems):
+    guild = discord.get_guild(timeline.guild_id)
+    year = len(timeline.timestamps)
+    where = f'{timeline.name} Year {year} PC'
+
+    if core.get_year_status(timeline)[1] != year:
+        problems.append(f'{where}: status reports Year {core.get_year_status(timeline)[1]} PC')
+
+    if guild.get_channel(timeline.year_vc).name != f'Current Year: {year} PC':
+        problems.append(f'{where}: year vc is "{guild.get_channel(timeline.year_vc).name}"')
+
+    wiki_year = find_text(wiki, timeline.wiki_page, r'Current Year: \d+ PC')
+
+    if wiki_year != f'Current Year: {year} PC':
+        problems.append(f'{where}: wiki says "{wiki_year}"')
+
+    if timeline.rollover is not None:
+        problems.append(f'{where}: rollover checkpoint left behind')
+
+    if any((year, channel_id) not in timeline.markers for channel_id in timeline.lore_channels):
+        problems.append(f'{where}: marker missing from the index')
+
+# --- Simulation ---
+
+async def check_backfill(timeline, problems):
+    # rebuilding the marker index from channel history has to agree with what the rollovers recorded
+    indexed = dict(timeline.markers)
+
+    started = time.perf_counter()
+    await core.backfill_markers(timeline)
+    seconds = time.perf_counter() - started
+
+    if timeline.markers != indexed:
+        problems.append(f'Backfill disagrees with the rollover index on {len(set(timeline.markers.items()) ^ set(indexed.items()))} markers')
+
+    return seconds
+
+async def simulate(options):
+    # seeded so a run can be replayed; nothing here needs cryptographic randomness
+    rng = random.Random(options.seed)  # noqa: S311
+    start = datetime(2030, 1, 4, 17, 0).timestamp()
+
+    clock = core.clock = VirtualClock(start + 1)
+    discord = FakeDiscord(clock.time, latency=options.latency)
+    wiki = FakeWiki({ wiki_page: wiki_text, **{ f'{wiki_page} {index}': wiki_text for index in range(1, options.timelines) } }, latency=options.latency)
+
+    write_config(await wiki.start(), start, options.reminders, options.timelines)
+    core.config.load_from_file()
+
+    build_guilds(discord)
+    discord.install(core.bot)
+
+    # the default timeline sets the pace and takes the perturbations; the rest roll over alongside it
+    timeline = core.config.default_timeline
+
+    failures = []
+    core.scheduler.on_error = failures.append
+    core.config.change_listeners.append(core.schedule_timeline)
+    core.schedule_all(catch_up=True)
+
+    log = []
+    problems = []
+    rollover_seconds = []
+    resume_at = None
+
+    started = time.perf_counter()
+
+    while len(timeline.timestamps) < options.years + 1:
+        when = core.scheduler.next_due()
+
+        if resume_at is not None and (when is None or resume_at < when):
+            clock.set(resume_at)
+            resume_at = None
+            resume(timeline, log)
+            continue
+
+        if when is None:
+            problems.append(f'Nothing scheduled after Year {len(timeline.timestamps)} PC')
+            break
+
+        clock.set(max(when, clock.time()))
+        years_before = { name: len(other.timestamps) for name, other in core.config.timelines.items() }
+
+        step_started = time.perf_counter()
+        await core.scheduler.run_pending()
+
+        advanced = [other for name, other in core.config.timelines.items() if len(other.timestamps) != years_before[name]]
+
+        if not advanced:
+            continue
+
+        rollover_seconds.append(time.perf_counter() - step_started)
+
+        for other in advanced:
+            if len(other.timestamps) != years_before[other.name] + 1:
+                problems.append(f'{other.name}: jumped from Year {years_before[other.name]} PC to Year {len(other.timestamps)} PC')
+
+            check_year(discord, wiki, other, problems)
+
+        perturbing = timeline in advanced and options.perturb_every and len(timeline.timestamps) % options.perturb_every == 0
+
+        if perturbing and (pause := perturb(timeline, rng, log)):
+            resume_at = clock.time() + pause
+
+    elapsed = time.perf_counter() - started
+    backfill_seconds = await check_backfill(timeline, problems)
+
+    await wiki.stop()
+
+    for client in clients.values():
+        await client.close()
+
+    simulated = len(timeline.timestamps) - 1
+
+    # request counts cover every timeline's rollovers
+    rollovers = sum(len(other.timestamps) - 1 for other in core.config.timelines.values())
+
+    return {
+        'years': simulated,
+        'timelines': len(core.config.timelines),
+        'timeline_years': rollovers,
+        'simulated_days': round((clock.time() - start) / 86400),
+        'wall_seconds': round(elapsed, 3),
+        'rollover_ms': {
+            'median': round(median(rollover_seconds) * 1000, 3) if rollover_seconds else 0,
+            'max': round(max(rollover_seconds) * 1000, 3) if rollover_seconds else 0,
+        },
+        'backfill_ms': round(backfill_seconds * 1000, 3),
+        'steps_ms': { labels['step']: { 'avg': round(average * 1000, 3), 'max': round(peak * 1000, 3) } for labels, _, average, peak in metrics.summary('attubot_rollover_step_seconds') },
+        'discord_requests': dict(discord.requests),
+        'wiki_requests': dict(wiki.requests),
+        'requests_per_year': {
+            'discord': round(sum(discord.requests.values()) / max(rollovers, 1), 2),
+            'wiki': round(sum(wiki.requests.values()) / max(rollovers, 1), 2),
+        },
+        'wiki_logins': sum(client.login_count for client in clients.values()),
+        'perturbations': [f'{action} {value}' if value is not None else action for action, value in log],
+        'failures': [repr(error) for error in failures],
+        'problems': problems,
+    }
+
+def report(result):
+    print(f'Simulated {result["years"]} years ({result["simulated_days"]} days) in {result["wall_seconds"]} s')
+    print(f'Timelines: {result["timelines"]} ({result["timeline_years"]} years between them)')
+    print(f'Rollover: median {result["rollover_ms"]["median"]} ms, max {result["rollover_ms"]["max"]} ms')
+
+    for step, timing in result['steps_ms'].items():
+        print(f'  {step:<16} avg {timing["avg"]:>9.3f} ms  max {timing["max"]:>9.3f} ms')
+
+    print(f'Marker backfill: {result["backfill_ms"]} ms')
+    print(f'Discord requests: {result["discord_requests"]} ({result["requests_per_year"]["discord"]} per year)')
+    print(f'Wiki requests: {result["wiki_requests"]} ({result["requests_per_year"]["wiki"]} per year, {result["wiki_logins"]} logins)')
+    print(f'Perturbations: {len(result["perturbations"])}')
+
+    for line in result['failures'] + result['problems']:
+        print(f'PROBLEM {line}')
+
+def compare(result, baseline_file, threshold):
+    baseline = json.loads(Path(baseline_file).read_text())['result']
+    regressions = []
+
+    for service, count in result['requests_per_year'].items():
+        if count > baseline['requests_per_year'].get(service, count):
+            regressions.append(f'{service} requests per year: {baseline["requests_per_year"][service]} -> {count}')
+
+    if baseline['rollover_ms']['median'] and result['rollover_ms']['median'] / baseline['rollover_ms']['median'] > threshold:
+        regressions.append(f'median rollover: {baseline["rollover_ms"]["median"]} ms -> {result["rollover_ms"]["median"]} ms')
+
+    for line in regressions:
+        print(f'REGRESSION {line}')
+
+    return not regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate attubot new year rollovers against local Discord and wiki stand-ins')
+    parser.add_argument('--years', type=int, default=300)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--perturb-every', type=int, default=10, help='dilate or pause/resume time every N years (0 to disable)')
+    parser.add_argument('--latency', type=float, default=0.0, help='artificial seconds added to every fake discord and wiki request')
+    parser.add_argument('--reminders', type=float, nargs='*', default=[24, 1], help='reminder hours to configure')
+    parser.add_argument('--timelines', type=int, default=1, help='timelines sharing the scheduler, each on its own server')
+    parser.add_argument('--output', default='sim_output.json', help='where to write the json results')
+    parser.add_argument('--baseline', help='previous results file to compare against')
+    parser.add_argument('--threshold', type=float, default=1.25, help='slowdown ratio counted as a regression')
+    args = parser.parse_args()
+
+    result = asyncio.run(simulate(args))
+    report(result)
+
+    Path(args.output).write_text(json.dumps({
+        'meta': {
+            'version': __version__,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'timezone': os.environ['TZ'],
+            'created': int(time.time()),
+            'args': vars(args),
+        },
+        'result': result,
+    }, indent=4))
+
+    print(f'Wrote results to {args.output}')
+
+    if result['failures'] or result['problems'] or (args.baseline and not compare(result, args.baseline, args.threshold)):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
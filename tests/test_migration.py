@@ -0,0 +1,98 @@
+"""
+AttuBot - Config to state store migration tests
+Author(s): @jhnhnck <john@jhnhnck.com>
+
+This file is licensed under the Apache License, Version 2.0; See LICENSE for full text.
+"""
+
+import json
+from pathlib import Path
+
+import pytest
+
+from attubot.config import Config
+
+sample = Path(__file__).resolve().parent.parent / 'config' / 'attu-bot.sample.json'
+
+@pytest.fixture
+def config_file(tmp_path, monkeypatch):
+    monkeypatch.delenv('BOT_STATE_FILE', raising=False)
+
+    raw = json.loads(sample.read_text())
+    raw['config_version'] = Config.config_version
+    raw['epoch'] = { 'time': 1704405600, 'year': 30, 'paused': True, 'length': 14 }
+    raw['timestamps'] = [101, 102, 103]
+    raw['rollover'] = { 'year': 4, 'steps': { 'lore_1': 401, 'wiki': True } }
+
+    path = tmp_path / 'attu-bot.json'
+    path.write_text(json.dumps(raw))
+
+    return path
+
+def load(path):
+    config = Config(path)
+    config.load_from_file()
+    config.store.close()
+
+    return config
+
+def edit(path, **values):
+    raw = json.loads(path.read_text())
+    raw.update(values)
+    path.write_text(json.dumps(raw))
+
+# --- First Load ---
+
+def test_first_load_imports_the_config(config_file):
+    timeline = load(config_file).default_timeline
+
+    assert (timeline.epoch_time, timeline.epoch_year, timeline.epoch_length, timeline.time_paused) == (1704405600, 30, 14, True)
+    assert timeline.timestamps == [101, 102, 103]
+    assert timeline.rollover == { 'year': 4, 'steps': { 'lore_1': 401, 'wiki': True } }
+
+    assert json.loads(config_file.read_text())['migrated_timelines'] == ['default']
+
+# --- Later Loads ---
+
+def test_store_wins_over_the_stale_config(config_file):
+    config = Config(config_file)
+    config.load_from_file()
+
+    timeline = config.default_timeline
+    timeline.set_epoch(1704405600 + 86400 * 14, 31, length=7, paused=False)
+    timeline.record_year(4, 104, [(4, 1, 401)], step='timestamp')
+    timeline.clear_rollover()
+    timeline.start_rollover(5)
+    timeline.finish_rollover_step('year_vc', True)
+    config.store.close()
+
+    edit(config_file, epoch={ 'time': 0, 'year': 1, 'paused': False, 'length': 1 }, timestamps=[])
+    timeline = load(config_file).default_timeline
+
+    assert (timeline.epoch_time, timeline.epoch_year, timeline.epoch_length, timeline.time_paused) == (1704405600 + 86400 * 14, 31, 7, False)
+    assert timeline.timestamps == [101, 102, 103, 104]
+    assert timeline.markers == { (4, 1): 401 }
+    assert timeline.rollover == { 'year': 5, 'steps': { 'year_vc': True } }
+
+# --- Lost State ---
+
+def test_lost_state_is_not_reimported(config_file):
+    load(config_file)
+
+    for path in config_file.parent.glob('attu-bot.db*'):
+        path.unlink()
+
+    with pytest.raises(RuntimeError, match='migrated_timelines'):
+        load(config_file)
+
+def test_unlisting_a_timeline_imports_it_again(config_file):
+    load(config_file)
+
+    for path in config_file.parent.glob('attu-bot.db*'):
+        path.unlink()
+
+    edit(config_file, migrated_timelines=[])
+    timeline = load(config_file).default_timeline
+
+    assert timeline.timestamps == [101, 102, 103]
+    assert json.loads(config_file.read_text())['migrated_timelines'] == ['default']
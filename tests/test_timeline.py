@@ -0,0 +1,72 @@
+"""
+AttuBot - Timeline rollover state tests
+Author(s): @jhnhnck <john@jhnhnck.com>
+
+This file is licensed under the Apache License, Version 2.0; See LICENSE for full text.
+"""
+
+import pytest
+
+from attubot.store import StateStore
+from attubot.timeline import Timeline
+
+epoch = { 'time': 1704405600, 'year': 1, 'paused': False, 'length': 7 }
+
+@pytest.fixture
+def store(tmp_path):
+    store = StateStore(tmp_path / 'attu-bot.db')
+    yield store
+    store.close()
+
+def load(store):
+    timeline = Timeline('default', store.timeline('default'))
+    timeline.load_state({ 'epoch': epoch, 'timestamps': [101] })
+    return timeline
+
+# --- Year Records ---
+
+def test_record_year_lands_with_its_step(store):
+    timeline = load(store)
+    timeline.start_rollover(2)
+    timeline.record_year(2, 202, [(2, 10, 201), (2, 11, 202)], step='timestamp')
+
+    reloaded = load(store)
+
+    assert reloaded.timestamps == [101, 202]
+    assert reloaded.markers == { (2, 10): 201, (2, 11): 202 }
+    assert reloaded.rollover == { 'year': 2, 'steps': { 'timestamp': True } }
+
+def test_record_year_survives_a_failing_listener(store):
+    def fail(timeline):
+        raise RuntimeError('listener')
+
+    timeline = load(store)
+    timeline.on_change = fail
+    timeline.start_rollover(2)
+
+    with pytest.raises(RuntimeError):
+        timeline.record_year(2, 202, [(2, 10, 202)], step='timestamp')
+
+    # the step is recorded, so a resumed rollover skips it instead of storing Year 2 PC again as Year 3 PC
+    reloaded = load(store)
+
+    assert reloaded.timestamps == [101, 202]
+    assert 'timestamp' in reloaded.rollover['steps']
+
+def test_record_year_is_keyed_on_the_year(store):
+    timeline = load(store)
+    timeline.start_rollover(2)
+    timeline.record_year(2, 202, [], step='timestamp')
+    timeline.record_year(2, 203, [], step='timestamp')
+
+    assert timeline.timestamps == [101, 203]
+    assert load(store).timestamps == [101, 203]
+
+def test_record_year_refuses_gaps(store):
+    timeline = load(store)
+    timeline.start_rollover(3)
+
+    with pytest.raises(ValueError, match='gap'):
+        timeline.record_year(3, 303, [], step='timestamp')
+
+    assert load(store).timestamps == [101]
@@ -0,0 +1,133 @@
+"""
+AttuBot - YearIndex regression tests
+Author(s): @jhnhnck <john@jhnhnck.com>
+
+This file is licensed under the Apache License, Version 2.0; See LICENSE for full text.
+"""
+
+import os
+import time
+from datetime import datetime, timedelta
+from datetime import time as clock_time
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from attubot.years import YearIndex
+
+zone = ZoneInfo('America/New_York')
+trigger = clock_time(17, 0)
+
+# a winter (EST) epoch on a thursday; years are a week long
+epoch = datetime(2024, 1, 4, 17, 0, tzinfo=zone)
+epoch_year = 100
+length = 7
+
+@pytest.fixture(autouse=True)
+def new_york():
+    # YearIndex reads local time through the process timezone
+    previous = os.environ.get('TZ')
+    os.environ['TZ'] = 'America/New_York'
+    time.tzset()
+
+    yield
+
+    if previous is None:
+        del os.environ['TZ']
+    else:
+        os.environ['TZ'] = previous
+
+    time.tzset()
+
+def old_status(now):
+    # get_year_status() and get_next_year() as they were before YearIndex, with the clock passed in
+    local_now = datetime.fromtimestamp(now, zone)
+    aware_trigger = clock_time(17, 0, tzinfo=zone)
+
+    # the epoch came back as a fixed-offset datetime, so the difference was in real seconds, not wall-clock days
+    local_epoch = datetime.fromtimestamp(epoch.timestamp()).astimezone()
+    elapsed_days = int((datetime.combine(local_now.date(), aware_trigger) - local_epoch).total_seconds() / 86400)
+    year = epoch_year + elapsed_days // length
+
+    if elapsed_days % length == 0 and local_now.time() < trigger:
+        year -= 1
+
+    next_date = datetime.combine(local_now.date(), aware_trigger) + timedelta((length - elapsed_days) % length)
+
+    if elapsed_days % length == 0 and local_now.time() >= trigger:
+        next_date += timedelta(days=length)
+
+    return elapsed_days, year, int(next_date.timestamp())
+
+def new_status(index, now):
+    elapsed_days, year = index.status(now)
+    return elapsed_days, year, index.next_year(now)
+
+def build_index():
+    return YearIndex((int(epoch.timestamp()), epoch_year, length), [], trigger, now=epoch.timestamp())
+
+def local(*fields):
+    return datetime(*fields, tzinfo=zone).timestamp()
+
+def sample(start, end, step=4021):
+    # an odd step (just over an hour) walks across every time of day
+    return range(int(start), int(end), step)
+
+# --- Standard Time ---
+
+@pytest.mark.parametrize(('start', 'end'), [
+    (local(2024, 1, 4, 17, 0), local(2024, 3, 10, 0, 0)),
+    (local(2024, 11, 4, 0, 0), local(2025, 3, 9, 0, 0)),
+])
+def test_matches_old_math_in_standard_time(start, end):
+    index = build_index()
+
+    for now in sample(start, end):
+        assert new_status(index, now) == old_status(now), datetime.fromtimestamp(now, zone)
+
+# --- Daylight Saving Time ---
+
+def test_dst_counts_calendar_days():
+    # 26 weeks after a winter epoch, but only 182 days less an hour of real time
+    index = build_index()
+    now = local(2024, 7, 4, 17, 30)
+
+    assert new_status(index, now) == (182, epoch_year + 26, local(2024, 7, 11, 17, 0))
+
+    # the old math truncated that lost hour into a whole day and missed the new year
+    assert old_status(now) == (181, epoch_year + 25, local(2024, 7, 5, 17, 0))
+
+def test_dst_year_starts_at_local_trigger_time():
+    index = build_index()
+
+    assert index.year_start(epoch_year + 10) == local(2024, 3, 14, 17, 0)
+    assert index.year_start(epoch_year + 26) == local(2024, 7, 4, 17, 0)
+    assert index.year_start(epoch_year + 44) == local(2024, 11, 7, 17, 0)
+
+# --- Trigger Edges ---
+
+@pytest.mark.parametrize(('day', 'weeks'), [
+    ((2024, 1, 11), 1),
+    ((2024, 3, 14), 10),
+    ((2024, 7, 4), 26),
+    ((2024, 11, 7), 44),
+])
+def test_year_turns_over_at_trigger_time(day, weeks):
+    index = build_index()
+
+    assert index.status(local(*day, 0, 0))[1] == epoch_year + weeks - 1
+    assert index.status(local(*day, 16, 59, 59))[1] == epoch_year + weeks - 1
+    assert index.status(local(*day, 17, 0))[1] == epoch_year + weeks
+    assert index.status(local(*day, 23, 59, 59))[1] == epoch_year + weeks
+
+    assert index.pending_rollover(local(*day, 16, 59, 59))
+    assert not index.pending_rollover(local(*day, 17, 0))
+
+def test_trigger_edges_match_old_math_in_standard_time():
+    index = build_index()
+
+    for day in range(4, 60):
+        midnight = local(2024, 1, 1, 0, 0) + day * 86400
+
+        for now in (midnight, midnight + 17 * 3600 - 1, midnight + 17 * 3600, midnight + 86399):
+            assert new_status(index, now) == old_status(now), datetime.fromtimestamp(now, zone)